@@ -3,7 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 
-from middleware import RequestMiddleware, SecurityStatus, Request
+from middleware import RequestMiddleware, CompressionMiddleware, SecurityStatus, Request
 from middleware.apploader import register_by
 from views.render import *
 from middleware.lifespan import on_startup, on_shutdown, lifespan_context
@@ -61,11 +61,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.COMPRESS_MIN_SIZE > 0:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESS_MIN_SIZE)
+
 # app.add_middleware(
 #     RequestMiddleware,
-#     check_salt=settings.CHECK_SALT,
-#     jwt_secret=None,
+#     public_key=open('public.pem').read(),
 #     url_filters=settings.URL_FILTERS,
+#     sample_rates=settings.ACCESS_LOG_SAMPLE,
+#     slow_threshold=settings.ACCESS_LOG_SLOW,
 # )
 
 
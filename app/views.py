@@ -16,3 +16,15 @@ def on_init(app: FastAPI):
     @app.get('/ping', description="健康检查")
     async def _():
         return Text('pong')
+
+    @app.get('/ready', description="就绪检查(必须的启动任务与预热完成, 且已使用的资源健康时返回200)")
+    async def _(request: Request):
+        startup = getattr(request.app.state, 'startup', None)
+        if startup is None:
+            return Json(None, code=-1, message='not ready', status=503)
+        resources = request.app.state.context.health_status
+        ready = startup.ready and all(item['status'] == 'ok' for item in resources.values())
+        report = {**startup.report(), 'ready': ready, 'resources': resources}
+        if not ready:
+            return Json(report, code=-1, message='not ready', status=503)
+        return Json(report, message='ready')
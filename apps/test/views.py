@@ -46,6 +46,17 @@ async def database_query(request: Request):
         return Json({'result': result.fetchone()})
 
 
+@router.get('/database/read')
+async def database_read(request: Request):
+    """
+    数据库只读查询(env: DATABASE_REPLICAS_DBTEST 配置只读副本, 未配置时使用主库)
+    """
+    request = Request.from_request(request)
+    async with request.context.database.read('dbtest', sticky=True)() as db:
+        result = await db.execute(text('SELECT 1'))
+        return Json({'result': result.fetchone()})
+
+
 @router.get('/cache')
 async def cache_query(request: Request):
     """
@@ -89,7 +100,7 @@ async def upload_task(request: Request):
     except:
         return Json(code=10001, message='Data must be a utf-8 string and a TaskEntry json object', status=400)
     try:
-        await request.context.amqp.send('test', task_obj)
+        await request.context.send_task('test', task_obj)
         return Json(message='Task uploaded successfully')
     except Exception as e:
         return Json(code=10002, message=str(e), status=400)
@@ -1,12 +1,13 @@
-try:
-    from . import views
-    on_init = views.router
-except ImportError:
-    # No View module
-    pass
-try:
-    from . import task
-    task_register = task.task_register
-except ImportError:
-    # No Task module
-    pass
+def __getattr__(name: str):
+    # 按需导入: Web 服务只导入 views, Worker 只导入 task
+    try:
+        if name == 'on_init':
+            from . import views
+            return views.router
+        if name == 'task_register':
+            from . import task
+            return task.task_register
+    except ImportError:
+        # No View/Task module
+        pass
+    raise AttributeError(name)
@@ -0,0 +1,15 @@
+"""
+views 与 task 共用的链上访问对象
+"""
+from data.rpc import RpcPool, LazyWeb3
+import settings
+
+# 多节点 RPC 连接池(启动时绑定 Context 的请求客户端, 与其他外部请求共享限频)
+rpc_pool = RpcPool(
+    settings.RPC_URLS,
+    hedge=settings.RPC_HEDGE,
+    hedge_ratio=settings.RPC_HEDGE_RATIO,
+)
+
+# 使用异步的Web3库组件(第一次使用时才导入 web3)
+w3 = LazyWeb3(rpc_pool)
@@ -1,7 +1,6 @@
 from typing import Any
 
 from starlette.exceptions import HTTPException
-from web3 import AsyncWeb3
 
 from tasks import TaskEntry, AppContext
 from data import Context
@@ -9,7 +8,7 @@ from data.logger import create_logger
 import asyncio
 
 from web3_db import insert_block, query
-from .views import w3, Block
+from .chain import w3, rpc_pool
 
 logger = create_logger('web3.task')
 
@@ -18,6 +17,7 @@ def task_register(app: AppContext):
     # 定时任务，每12s查询最新区块的数据
     @app.loop('web3')
     async def web3_task_worker(task: TaskEntry, context: Context):
+        await rpc_pool.use_client(context.client)
         while True:
             # 连接
             if not await w3.is_connected():
@@ -1,14 +1,20 @@
 from typing import List
-from fastapi import APIRouter, BackgroundTasks
-from fastapi.responses import StreamingResponse
-from io import BytesIO
-from web3 import AsyncWeb3
+from collections import OrderedDict
+from fastapi import APIRouter, BackgroundTasks, Response, Query
 from starlette.exceptions import HTTPException
 from pydantic import BaseModel, field_validator
 import starlette.requests
+import asyncio
+import time
+import settings
 from starlette.templating import Jinja2Templates
-from data import create_logger
-from web3_db import get_blocks, get_block, insert_block, query
+from data import Context, create_logger
+from .chain import rpc_pool, w3
+from middleware.lifespan import on_startup, on_warmup
+from middleware.compress import PrecompressedAsset
+from web3_db import get_blocks, get_block, insert_block, replace_block, query, get_block_page, stream_blocks
+from views.render import Json, JsonStream, RawJson, HTTPException as JsonHTTPException
+from data.db import InvalidCursor
 
 """
 路由文件，路径：/api/v1/web3
@@ -21,9 +27,119 @@ router = APIRouter(prefix='/api/v1/web3')
 # 注：填写以main.py文件作为起始，来填目录
 templates = Jinja2Templates(directory='templates')
 
-# 使用异步的Web3库组件
-w3 = AsyncWeb3(
-    AsyncWeb3.AsyncHTTPProvider('https://mainnet.infura.io/v3/2a1f54e725154a56bd24606f28b283f2?enable=archive'))
+@on_startup(required=True)
+async def bind_rpc_client(app):
+    # Web 服务传入 FastAPI, Worker 传入 Context
+    context = app if isinstance(app, Context) else app.state.context
+    await rpc_pool.use_client(context.client)
+
+
+# 链上最新区块号(缓存 BLOCK_HEAD_TTL 秒), 用于判断区块是否已不可逆
+class ChainHead:
+    def __init__(self, ttl: float) -> None:
+        self.number: int | None = None
+        self._ttl = ttl
+        self._checked = float('-inf')
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> int | None:
+        if time.monotonic() - self._checked < self._ttl:
+            return self.number
+        async with self._lock:
+            if time.monotonic() - self._checked >= self._ttl:
+                try:
+                    self.number = await w3.eth.block_number
+                except Exception as e:
+                    # 节点不可用时继续使用旧值(没有旧值时不做不可逆判断)
+                    logger.warning(f'获取最新区块号失败: {e!r}')
+                # 失败同样在 ttl 内不再重试, 避免等待者在锁上逐个请求节点
+                self._checked = time.monotonic()
+        return self.number
+
+    async def finalized(self, number: int) -> bool:
+        head = await self.get()
+        return head is not None and number <= head - settings.BLOCK_FINALITY_DEPTH
+
+
+chain_head = ChainHead(settings.BLOCK_HEAD_TTL)
+
+# 区块响应格式变化时修改版本号, 使客户端/CDN 缓存的不可逆区块失效
+# v2: 不可逆区块返回前先与链上哈希核对(v1 可能缓存了被重组的区块)
+BLOCK_ETAG_VERSION = 'v2'
+# 已与链上哈希核对过的不可逆区块号(最多记录 VERIFIED_BLOCKS_MAX 个)
+VERIFIED_BLOCKS_MAX = 100_000
+verified_blocks: OrderedDict[int, None] = OrderedDict()
+
+
+def block_to_dict(block) -> dict:
+    return {
+        'number': block.number,
+        'hash': block.hash.hex(),
+        'timestamp': block.timestamp,
+        'transactions': ",".join([tx.hex() for tx in block.transactions])
+    }
+
+
+def mark_verified(number: int):
+    verified_blocks[number] = None
+    verified_blocks.move_to_end(number)
+    if len(verified_blocks) > VERIFIED_BLOCKS_MAX:
+        verified_blocks.popitem(last=False)
+
+
+async def verify_finalized(block) -> dict | None:
+    """
+    数据库中的区块可能是在不可逆之前写入、之后被重组的旧区块: 第一次按不可逆返回前与链上哈希核对,
+    不一致时用链上数据覆盖数据库; 返回修正后的区块(一致时返回 None), 节点不可用时抛出异常
+    """
+    if block.number in verified_blocks:
+        return None
+    chain_block = block_to_dict(await w3.eth.get_block(block.number))
+    corrected = None
+    if chain_block['hash'] != block.hash:
+        logger.warning(f'区块 {block.number} 已被重组, 更新数据库: {block.hash} -> {chain_block["hash"]}')
+        await replace_block(chain_block)
+        corrected = chain_block
+    mark_verified(block.number)
+    return corrected
+
+
+def block_etag(number: int, block_hash: str | None = None) -> str:
+    """
+    不可逆区块的内容只由区块号决定, ETag 不需要查询数据库; 接近链头的区块用区块哈希区分(可能被重组)
+    """
+    if block_hash is None:
+        return f'"block-{number}-{BLOCK_ETAG_VERSION}"'
+    return f'"block-{number}-{block_hash.removeprefix("0x")[:16]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in [value.strip().removeprefix('W/') for value in if_none_match.split(',')]
+
+
+def block_cache_headers(finalized: bool, etag: str) -> dict[str, str]:
+    if finalized:
+        return {'ETag': etag, 'Cache-Control': 'public, max-age=31536000, immutable'}
+    return {'ETag': etag, 'Cache-Control': f'public, max-age={settings.BLOCK_HEAD_MAX_AGE}'}
+
+
+# 静态的下载文件与K线页面, 启动时预先压缩
+swap_csv = PrecompressedAsset.from_file(
+    'files/swap.csv', 'application/octet-stream', headers={"Content-Disposition": "attachment; filename=swap.csv"})
+kline_html = PrecompressedAsset.from_template(templates, 'UniSwap-V2_Kline_with_Volume.html')
+
+
+@on_warmup
+async def precompress_assets(app):
+    await asyncio.gather(swap_csv.prepare(), kline_html.prepare())
+
+
+@on_warmup
+async def warm_chain_head(app):
+    # 预先获取最新区块号, 第一个区块请求即可判断是否不可逆
+    await chain_head.get()
 
 
 # 区块信息
@@ -73,18 +189,37 @@ async def query_blocks(numbers: list[int]):
 
 # 根据区块号获取区块数据
 @router.get("/{number}", response_model=Block, summary='获取特定区块的数据（number示例：22106262）')
-async def get_by_block_number(number: int):
-    # 连接
-    if not await w3.is_connected():
-        raise HTTPException(status_code=404, detail="节点连接失败，请重试!")
+async def get_by_block_number(number: int, request: starlette.requests.Request, response: Response):
+    # 不可逆区块: 客户端缓存仍然有效时直接返回304(不查询数据库与节点)
+    finalized = await chain_head.finalized(number)
+    if finalized:
+        etag = block_etag(number)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=block_cache_headers(True, etag))
 
     # 先从sqlite数据库获取
     block = await get_block(number)
     # 有，则直接return
     if block is not None:
         print("数据库存在，直接返回")
+        if finalized:
+            try:
+                block = await verify_finalized(block) or block
+            except Exception as e:
+                # 无法核对时按接近链头的区块返回(短缓存)
+                logger.warning(f'核对区块 {number} 失败: {e!r}')
+                finalized = False
+        hash_value = block['hash'] if isinstance(block, dict) else block.hash
+        etag = block_etag(number) if finalized else block_etag(number, hash_value)
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=block_cache_headers(finalized, etag))
+        response.headers.update(block_cache_headers(finalized, etag))
         return block
 
+    # 连接
+    if not await w3.is_connected():
+        raise HTTPException(status_code=404, detail="节点连接失败，请重试!")
+
     # 没有，则查询链上数据
     # 获取区块
     try:
@@ -93,16 +228,13 @@ async def get_by_block_number(number: int):
         raise HTTPException(status_code=404, detail="未找到对应区块!")
 
     # 将区块数据转换为字典对象
-    block_data = {
-        'number': block.number,
-        'hash': block.hash.hex(),
-        'timestamp': block.timestamp,
-        'transactions': ",".join([tx.hex() for tx in block.transactions])
-    }
+    block_data = block_to_dict(block)
     # print(block_data)
 
     # 将查询到的数据，存入到sqlite本地数据库
     await insert_block(block_data)  # 转化为字典对象，sqlalchemy数据库操作要求！
+    if finalized:
+        mark_verified(number)
 
     inserted_block = await get_block(number)  # 新增检查
     assert inserted_block is not None
@@ -110,6 +242,7 @@ async def get_by_block_number(number: int):
         f"number: {inserted_block.number}, hash: {inserted_block.hash}, timestamp: {inserted_block.timestamp}, transactions: {inserted_block.transactions}")
 
     # 返回
+    response.headers.update(block_cache_headers(finalized, block_etag(number) if finalized else block_etag(number, block_data['hash'])))
     return block_data
 
 
@@ -143,46 +276,53 @@ async def get_blocks_by_range(block_range: Range, tasks: BackgroundTasks):
 
     # 修改后：直接从本地sqlite数据库中获取
     # 后续返回的结果集
+    # 数据库中的数据是可信的, 直接返回字典(不再逐条 pydantic 校验)
     block_list = await get_blocks(block_range.start, block_range.end)
-    # 将数据库获取到的字典对象，转化为对应pydantic模型实例
-    block_list = [Block.model_validate(block) for block in block_list]
 
     # 获取区块号列表
     numbers = list(range(block_range.start, block_range.end))
     # 取差集
-    numbers = list(set(numbers).difference(set([block.number for block in block_list])))
+    numbers = list(set(numbers).difference(set([block['number'] for block in block_list])))
 
     # print(numbers)
 
     # 开启一个后台任务去查询对应区块范围（只查在数据库中不存在的区块）的数据，并同步到数据库中
     tasks.add_task(query_blocks, numbers)
 
-    return block_list
+    return RawJson(block_list)
 
 
 # 获取数据库中的前100条区块数据，按照时间戳排序
 @router.get("/block/news", response_model=List[Block], summary='获取数据库中最新的100条区块数据')
 async def get_new_blocks():
-    block_list = await query()
-    return block_list
+    return RawJson(await query())
+
+
+# 游标分页获取数据库中的区块数据(按区块号倒序), 下一页传入上一页返回的 next
+@router.get("/block/page", summary='分页获取数据库中的区块数据')
+async def get_block_page_view(cursor: str | None = None, limit: int = Query(100, ge=1, le=1000)):
+    try:
+        return Json(await get_block_page(cursor, limit))
+    except InvalidCursor:
+        raise JsonHTTPException(code=-2, message='Invalid cursor', status_code=400)
+
+
+# 流式导出区块范围内的数据(不限制范围大小)
+@router.get("/block/export", summary='流式导出区块范围内的数据')
+async def export_blocks(start: int, end: int):
+    return JsonStream(stream_blocks(start, end))
 
 
 # 获取一版1年的Swap事件的Log数据
 @router.get("/logs/download", summary='获取一版1年的Swap事件的Log数据（可下载）')
-async def get_swap_logs_in_one_year():
-    # 这个路径是相对main（也就是你创建的app所在的目录下而言的）
-    file_path = "files/swap.csv"
-    # 读取文件
-    with open(file_path, "rb") as file:
-        file_content = file.read()
-    file_like = BytesIO(file_content)
-    file_like.seek(0)
-    headers = {"Content-Disposition": "attachment; filename=swap.csv"}
-    return StreamingResponse(file_like, media_type="application/octet-stream", headers=headers)
+async def get_swap_logs_in_one_year(request: starlette.requests.Request):
+    # 文件路径相对main（也就是你创建的app所在的目录下而言的）, 内容在启动时读取并压缩
+    return await swap_csv.response(request)
 
 
 # 获取一版1年Log数据计算出来的Swap事件绘制而成的K线
 @router.get('/kline/html',
             summary='获取一版1年Log数据计算出来的Swap事件绘制而成的K线（注：需要通过接口直接访问！测试文档无法直接跳转！）')
 async def get_kline(request: starlette.requests.Request):
-    return templates.TemplateResponse('UniSwap-V2_Kline_with_Volume.html', {'request': request})
+    # 模板不依赖请求内容, 直接返回启动时渲染并压缩好的页面
+    return await kline_html.response(request)
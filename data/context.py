@@ -1,36 +1,203 @@
 import time
 from .cache import RedisConfig, Cache
 from .rabbit import RabbitConfig, RabbitMQ
-from .db import DatabaseConfig, declare_database, close_all_sessions, DatabaseFactory
-from .fetch import AsyncLimitClient
+from .db import DatabaseConfig, declare_database, close_all_sessions, DatabaseFactory, pool_stats
+from .metrics import MetricsRegistry
+from .fetch import AsyncLimitClient, RedisLimiter
+from .httpcache import ResponseCache, MemoryCacheStorage, RedisCacheStorage, jsonrpc_rule
 from .logger import create_logger
-from typing import Any
+from typing import Any, Awaitable, Callable, Iterable
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.engine import ExceptionContext
+from contextvars import ContextVar
+import sqlalchemy as sa
+import itertools
+import collections
+import functools
 import traceback
 import asyncio
 import sys
 
 
+# 当前上下文(请求/任务)中各数据库最近一次提交到主库的时间(只替换不修改, 不会影响其他上下文)
+_last_writes: ContextVar[dict[str, float]] = ContextVar('database_last_writes', default={})
+
+
+class _DatabaseState:
+    """
+    单个数据库的健康状态: 出现断连错误后标记为不健康, 重新建立连接成功后恢复
+    """
+    def __init__(self, factory: DatabaseFactory) -> None:
+        self.factory = factory
+        self.healthy = True
+        self.error: str | None = None
+        self.attempts = 0  # 连续重建次数(决定退避时间)
+        self.retry_at = 0.0
+        self.latency: float | None = None  # 查询耗时的指数移动平均(秒), 只统计只读副本
+
+    @property
+    def engine(self) -> AsyncEngine:
+        return self.factory.kw['bind']
+
+    def on_error(self, context: ExceptionContext):
+        # 只有断连/建立连接失败才需要重建连接池, 约束冲突等错误与连接无关
+        if context.is_disconnect or context.connection is None:
+            self.healthy = False
+            self.error = str(context.original_exception)
+
+    def on_connect(self, *args):
+        self.healthy = True
+        self.error = None
+        self.attempts = 0
+
+    def on_before_execute(self, conn, *args):
+        conn.info['query_start'] = time.perf_counter()
+
+    def on_after_execute(self, conn, *args):
+        start = conn.info.pop('query_start', None)
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            self.latency = elapsed if self.latency is None else self.latency * 0.8 + elapsed * 0.2
+
+
 class DatabaseProxy:
     __METHODS__ = {
-        'restart'
+        'restart', 'recover', 'ping', 'created', 'stats', 'export', 'read'
     }
 
-    async def restart(self):
-        await close_all_sessions()
-        for db_name in self._dbs:
-            self._dbs[db_name] = declare_database(self._db_configs[db_name])
+    async def restart(self, *names: str):
+        """
+        重建指定(默认全部已创建的)数据库连接池, 已借出的连接归还时关闭, 不影响其他数据库
+        """
+        for db_name in names or list(self._states):
+            state = self._states.get(db_name)
+            if state is not None:
+                await state.engine.dispose()
+
+    async def recover(self) -> list[str]:
+        """
+        重建被标记为不健康的数据库连接池, 同一数据库按指数退避(最长 max_backoff 秒)重试, 返回本次重建的数据库
+        """
+        now = time.monotonic()
+        rebuilt = []
+        for db_name, state in self._states.items():
+            if state.healthy or now < state.retry_at:
+                continue
+            state.retry_at = now + min(self._backoff * 2 ** state.attempts, self._max_backoff)
+            state.attempts += 1
+            await state.engine.dispose()
+            rebuilt.append(db_name)
+        return rebuilt
+
+    def read(self, key: str, *, sticky: bool = False) -> DatabaseFactory:
+        """
+        只读会话工厂: 按 read_routing 从健康的只读副本中选择, 没有可用副本时使用主库;
+        sticky=True 时, 当前上下文 sticky_window 秒内向主库提交过的数据库仍读主库(读写一致)
+        """
+        primary = self[key]
+        config = self._db_configs[key]
+        if not config.replicas:
+            return primary
+        if sticky and time.monotonic() - _last_writes.get().get(key, float('-inf')) < config.sticky_window:
+            return primary
+        replicas = self._replicas.get(key)
+        if replicas is None:
+            replicas = self._replicas[key] = []
+            for index, url in enumerate(config.replicas):
+                state = self._create(f'{key}.replica{index}', config.model_copy(update={'url': url, 'replicas': []}))
+                sa.event.listen(state.engine.sync_engine, 'before_cursor_execute', state.on_before_execute)
+                sa.event.listen(state.engine.sync_engine, 'after_cursor_execute', state.on_after_execute)
+                replicas.append(state)
+        healthy = [state for state in replicas if state.healthy]
+        if not healthy:
+            return primary
+        if config.read_routing == 'latency':
+            # 还没有延迟数据的副本优先, 保证每个副本都被测量
+            return min(healthy, key=lambda state: state.latency or 0.0).factory
+        return healthy[next(self._round_robin[key]) % len(healthy)].factory
+
+    async def ping(self, key: str):
+        """
+        健康检查: 在指定数据库上执行 SELECT 1
+        """
+        state = self._states.get(key)
+        async with (state.factory if state is not None else self[key])() as session:
+            await session.execute(sa.text('SELECT 1'))
+
+    @property
+    def created(self) -> list[str]:
+        """
+        已创建连接池的数据库
+        """
+        return list(self._states)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """
+        各数据库的健康状态与连接池统计, 用于调整 pool_size 与 max_overflow
+        """
+        return {
+            db_name: {'healthy': state.healthy, 'error': state.error, 'latency': state.latency, **pool_stats(state.engine)}
+            for db_name, state in self._states.items()
+        }
+
+    def export(self, registry: MetricsRegistry):
+        """
+        将连接池统计注册到指标注册表(每次导出时刷新)
+        """
+        gauges = {
+            name: registry.gauge(f'db_pool_{name}', documentation, ('database',))
+            for name, documentation in (
+                ('healthy', 'Database is healthy (1) or waiting to reconnect (0)'),
+                ('size', 'Configured pool size'),
+                ('checked_out', 'Connections currently checked out'),
+                ('overflow', 'Overflow connections in use'),
+                ('timeouts', 'Checkouts that timed out'),
+                ('wait_max', 'Longest checkout wait in seconds'),
+                ('wait_avg', 'Average checkout wait in seconds'),
+            )
+        }
+
+        @registry.collector
+        def collect():
+            for db_name, stats in self.stats().items():
+                for name, gauge in gauges.items():
+                    if stats.get(name) is not None:
+                        gauge.set(float(stats[name]), database=db_name)
+
+    def __init__(self, configs: dict[str, DatabaseConfig], backoff: float = 1.0, max_backoff: float = 30.0) -> None:
+        self._states: dict[str, _DatabaseState] = {}
+        self._db_configs = configs
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._replicas: dict[str, list[_DatabaseState]] = {}
+        self._round_robin: dict[str, itertools.count] = collections.defaultdict(itertools.count)
 
-    def __init__(self, dbs: dict[str, tuple[DatabaseFactory, DatabaseConfig]]) -> None:
-        self._dbs = {key: db[0] for key, db in dbs.items()}
-        self._db_configs = {key: db[1] for key, db in dbs.items()}
+    def _create(self, name: str, config: DatabaseConfig) -> _DatabaseState:
+        state = self._states[name] = _DatabaseState(declare_database(config))
+        sa.event.listen(state.engine.sync_engine, 'handle_error', state.on_error)
+        sa.event.listen(state.engine.sync_engine, 'connect', state.on_connect)
+        return state
 
     def __getitem__(self, key: str) -> DatabaseFactory:
-        return self._dbs[key]
+        state = self._states.get(key)
+        if state is None:
+            # 首次访问时才创建连接池
+            state = self._create(key, self._db_configs[key])
+
+            def on_commit(conn):
+                _last_writes.set({**_last_writes.get(), key: time.monotonic()})
+
+            sa.event.listen(state.engine.sync_engine, 'commit', on_commit)
+        return state.factory
 
     def __getattribute__(self, name: str) -> DatabaseFactory:
         if name.startswith('_') or name in self.__METHODS__:
             return super().__getattribute__(name)
-        return self._dbs[name]
+        return self[name]
+
+
+# 各资源建立连接/健康检查的默认超时时间(秒)
+RESOURCE_TIMEOUTS = {'cache': 2.0, 'amqp': 5.0, 'database': 5.0}
 
 
 class Context:
@@ -41,6 +208,16 @@ class Context:
         rabbit: RabbitConfig | None = None,
         limits: int = 20,
         period: float = 1.0,
+        limiter_key: str | None = None,
+        http_cache: str | None = None,
+        coalesce: bool = False,
+        http2: bool = False,
+        finality_depth: int = 64,
+        recent_ttl: float = 6.0,
+        warmup: Iterable[str] = (),
+        timeouts: dict[str, float] | None = None,
+        probe_interval: float = 0,
+        task_priorities: dict[str, int] | None = None,
     ) -> None:
         self._loop = None
         self._cache = None
@@ -49,10 +226,26 @@ class Context:
         self._cache_config = cache
         self._rabbit_config = rabbit
         self._databases = databases
-        self._client = AsyncLimitClient(limits=limits, sleeps=period)
+        self._limits = limits
+        self._period = period
+        # HTTP/2 下并发由流数量限制, 与 AsyncLimitClient 的默认值保持一致
+        self._concurrency = 100 if http2 else limits
+        self._limiter_key = limiter_key
+        self._http_cache = http_cache
+        # 距最新区块不足 finality_depth 个的区块响应只缓存 recent_ttl 秒(可能被重组)
+        self._finality_depth = finality_depth
+        self._recent_ttl = recent_ttl
+        self._client = AsyncLimitClient(limits=limits, sleeps=period, coalesce=coalesce, http2=http2)
         self._logger = create_logger('context', index=True, ecosystem=False)
         self._configs = {}
         self._init = False
+        # warmup: 启动时在后台预先连接的资源(cache/amqp/database), 其余资源在首次使用时才连接
+        self._warmup = set(warmup)
+        self._timeouts = {**RESOURCE_TIMEOUTS, **(timeouts or {})}
+        self._probe_interval = probe_interval
+        self._health: dict[str, dict[str, Any]] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+        self._task_priorities = dict(task_priorities or {})
 
     def __getitem__(self, key: str) -> Any:
         return self._configs[key]
@@ -60,35 +253,97 @@ class Context:
     def __setitem__(self, key: str, value: Any) -> None:
         self._configs[key] = value
 
-    async def close(self):
-        if self._cache is not None:
-            await self._cache.close()
-        if self._amqp is not None:
-            await self._amqp.close()
-        if self._dbs:
-            await close_all_sessions()
-        await self._client.aclose()
-
     async def initalize(self):
         if not self._init:
             self._loop = asyncio.get_event_loop()
-            if self._cache_config is not None:
-                self._cache = Cache(self._cache_config)
-            if self._rabbit_config is not None:
-                self._amqp = RabbitMQ(self._rabbit_config)
+            if self._cache_config is not None and self._limiter_key:
+                # 所有使用相同 key 的进程共享同一份请求预算(第一次请求时才创建 Redis 连接)
+                self._client.use_limiter(RedisLimiter(
+                    lambda: self.cache.backend, self._limiter_key,
+                    limits=self._limits, period=self._period, concurrency=self._concurrency
+                ))
+            if self._http_cache:
+                # memory: 进程内 LRU; redis: 与其他进程共享(需要配置 cache)
+                storage = RedisCacheStorage(self.cache) if self._http_cache == 'redis' and self._cache_config is not None else MemoryCacheStorage()
+                self._client.use_cache(ResponseCache(storage, rules=[jsonrpc_rule(finality_depth=self._finality_depth, recent_ttl=self._recent_ttl)]))
             if self._databases is not None:
                 if isinstance(self._databases, dict):
-                    self._dbs = DatabaseProxy({
-                        key: (declare_database(database), database)
-                        for key, database in self._databases.items()
-                    })
+                    self._dbs = DatabaseProxy(dict(self._databases))
                 elif isinstance(self._databases, list):
                     self._dbs = DatabaseProxy({
-                        database.url.split('/')[-1]: (declare_database(database), database)
+                        database.url.split('/')[-1]: database
                         for database in self._databases
                     })
+            # 预热与健康检查都在后台进行, 不可用的依赖不会拖慢启动
+            if self._warmup:
+                self._tasks.append(self._loop.create_task(self.warmup(self._warmup), name='Context.warmup'))
+            if self._probe_interval > 0:
+                self._tasks.append(self._loop.create_task(self._probe_loop(), name='Context.probe'))
             self._init = True
 
+    async def warmup(self, resources: Iterable[str] = ('cache', 'amqp', 'database')) -> dict[str, dict[str, Any]]:
+        """
+        预先建立指定资源的连接并检查, 每个资源单独超时, 失败只记录不抛出
+        """
+        resources = set(resources)
+        if 'cache' in resources and self._cache_config is not None:
+            self.cache
+        if 'amqp' in resources and self._rabbit_config is not None:
+            self.amqp
+        if 'database' in resources and self._dbs is not None:
+            for key in self._dbs._db_configs:
+                self._dbs[key]
+        return await self.health()
+
+    def _checks(self) -> dict[str, Callable[[], Awaitable[Any]]]:
+        # 只检查已经使用过(已创建)的资源
+        checks = {}
+        if self._cache is not None:
+            checks['cache'] = self._cache.backend.ping
+        if self._amqp is not None:
+            checks['amqp'] = self._amqp.ping
+        if self._dbs is not None:
+            for key in self._dbs.created:
+                checks[f'database.{key}'] = functools.partial(self._dbs.ping, key)
+        return checks
+
+    async def _probe(self, name: str, check: Callable[[], Awaitable[Any]]) -> dict[str, Any]:
+        begin = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), self._timeouts.get(name.split('.')[0]))
+            status: dict[str, Any] = {'status': 'ok'}
+        except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+            raise
+        except Exception as e:
+            status = {'status': 'down', 'error': str(e) or type(e).__name__}
+        status['elapsed'] = round((time.perf_counter() - begin) * 1000, 1)
+        status['checked'] = self.ts
+        previous = self._health.get(name)
+        if status['status'] == 'down' and (previous is None or previous['status'] != 'down'):
+            self._logger.warning(f"Resource {name} is down: {status['error']}")
+        elif status['status'] == 'ok' and previous is not None and previous['status'] == 'down':
+            self._logger.info(f"Resource {name} is back")
+        self._health[name] = status
+        return status
+
+    async def health(self) -> dict[str, dict[str, Any]]:
+        """
+        立即检查所有已使用的资源, 返回 {资源名: {'status': 'ok'/'down', 'elapsed': 毫秒, ...}}
+        """
+        checks = self._checks()
+        results = await asyncio.gather(*(self._probe(name, check) for name, check in checks.items()))
+        return dict(zip(checks, results))
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.sleep(self._probe_interval)
+            try:
+                await self.health()
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                raise
+            except Exception:
+                self._logger.exception("Resource health probe failed")
+
     async def __aenter__(self) -> 'Context':
         await self.initalize()
         return self
@@ -97,11 +352,13 @@ class Context:
         await self.close()
 
     async def close(self):
+        for task in self._tasks:
+            task.cancel()
         if self._cache is not None:
             await self._cache.close()
         if self._amqp is not None:
             await self._amqp.close()
-        if self._dbs:
+        if self._dbs is not None and self._dbs.created:
             await close_all_sessions()
         await self._client.aclose()
 
@@ -112,9 +369,11 @@ class Context:
     @property
     def cache(self) -> Cache:
         """
-        获取缓存对象
+        获取缓存对象(首次访问时创建)
         """
-        assert self._cache is not None, "cache is not configured"
+        if self._cache is None:
+            assert self._cache_config is not None, "cache is not configured"
+            self._cache = Cache(self._cache_config)
         return self._cache
 
     @property
@@ -127,11 +386,22 @@ class Context:
     @property
     def amqp(self) -> RabbitMQ:
         """
-        获取消息队列对象
+        获取消息队列对象(首次访问时创建, 首次收发消息时才连接)
         """
-        assert self._amqp is not None, "rabbitmq is not configured"
+        if self._amqp is None:
+            assert self._rabbit_config is not None, "rabbitmq is not configured"
+            self._amqp = RabbitMQ(self._rabbit_config, timeout=self._timeouts.get('amqp'))
         return self._amqp
 
+    async def send_task(self, queue: str, task: Any, **dump_kws):
+        """
+        发送任务消息, 未指定 priority 时使用 task_priorities 中该任务名(task.task)的优先级
+        """
+        name = getattr(task, 'task', None)
+        if 'priority' not in dump_kws and name in self._task_priorities:
+            dump_kws['priority'] = self._task_priorities[name]
+        await self.amqp.send(queue, task, **dump_kws)
+
     @property
     def database(self) -> DatabaseProxy:
         """
@@ -140,6 +410,13 @@ class Context:
         assert self._dbs is not None, "database is not configured"
         return self._dbs
 
+    @property
+    def health_status(self) -> dict[str, dict[str, Any]]:
+        """
+        最近一次健康检查的结果(未使用过的资源不会出现)
+        """
+        return dict(self._health)
+
     @property
     def client(self) -> AsyncLimitClient:
         """
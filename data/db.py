@@ -1,14 +1,35 @@
+from typing import Any, AsyncIterator, Iterable, Literal, Mapping, Sequence
 from pydantic import BaseModel
-from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession, create_async_engine, close_all_sessions
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession, AsyncEngine, create_async_engine, close_all_sessions
 from sqlalchemy.orm import declarative_base, as_declarative, declared_attr
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import sqlalchemy as sa
+import sqlalchemy.event
+import sqlalchemy.exc
+import operator
+import base64
+import json as jsonlib
+import sqlite3
+import time
 
 
 class CustomBase:
     def as_dict(self):
         """
-        字典化 ORM 实例
+        字典化 ORM 实例(列名与取值函数按类缓存)
         """
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        cls = type(self)
+        cached = cls.__dict__.get('_as_dict_getter')
+        if cached is None:
+            names = tuple(c.name for c in self.__table__.columns)
+            getter = operator.attrgetter(*names)
+            cached = (names, getter if len(names) > 1 else lambda obj: (getter(obj),))
+            setattr(cls, '_as_dict_getter', cached)
+        names, getter = cached
+        return dict(zip(names, getter(self)))
 
 
 Base = declarative_base(cls=CustomBase)
@@ -16,48 +37,312 @@ Base = declarative_base(cls=CustomBase)
 DatabaseFactory = async_sessionmaker[AsyncSession]
 
 
+class SqlitePragmas(BaseModel):
+    """
+    SQLite 连接参数, 每个新连接建立时执行 PRAGMA, 字段为 None 时保持 SQLite 默认值
+    """
+    journal_mode: str | None = 'wal'  # WAL: 读写互不阻塞, 多进程共享同一文件时减少锁等待
+    synchronous: str | None = 'normal'  # WAL 下 NORMAL 不会损坏数据库, 只在断电时可能丢失最后的事务
+    busy_timeout: int | None = 5000  # 等待写锁的最长时间(毫秒)
+    mmap_size: int | None = 256 * 1024 * 1024  # 内存映射读取的大小(字节)
+    cache_size: int | None = -64 * 1024  # 页缓存大小, 负数单位为 KB
+    temp_store: str | None = 'memory'  # 临时表与排序使用内存
+
+    def statements(self) -> list[str]:
+        return [f'PRAGMA {name}={value}' for name, value in self.model_dump().items() if value is not None]
+
+
 class DatabaseConfig(BaseModel):
     url: str
     pool_size: int = 1
     max_overflow: int = 4
     autoflush: bool = True
+    sqlite: SqlitePragmas | None = SqlitePragmas()
+    replicas: list[str] = []  # 只读副本, 使用与主库相同的连接池参数
+    read_routing: Literal['round_robin', 'latency'] = 'round_robin'  # 读请求在副本间轮询或选择平均延迟最低的副本
+    sticky_window: float = 5.0  # 读写一致: 当前上下文写入主库后多少秒内的读请求仍使用主库
 
     def __init__(
             self, url: str, *,
             pool_size: int = 1,
             max_overflow: int = 4,
-            autoflush: bool = True
+            autoflush: bool = True,
+            sqlite: SqlitePragmas | None = SqlitePragmas(),
+            replicas: list[str] | None = None,
+            read_routing: Literal['round_robin', 'latency'] = 'round_robin',
+            sticky_window: float = 5.0
     ) -> None:
         super().__init__(
             url=url,
             pool_size=pool_size,
             max_overflow=max_overflow,
-            autoflush=autoflush
+            autoflush=autoflush,
+            sqlite=sqlite,
+            replicas=replicas or [],
+            read_routing=read_routing,
+            sticky_window=sticky_window
         )
 
 
+class PoolStats:
+    """
+    获取连接的等待统计(连接池 dispose 重建后保留)
+    """
+    def __init__(self) -> None:
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def observe(self, elapsed: float):
+        self.waits += 1
+        self.wait_total += elapsed
+        self.wait_max = max(self.wait_max, elapsed)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    记录每次获取连接等待时间的连接池
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        begin = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.observe(time.perf_counter() - begin)
+
+    def recreate(self) -> 'TimedQueuePool':
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_stats(engine: AsyncEngine) -> dict[str, Any]:
+    """
+    连接池状态: 容量、已借出、溢出连接数与获取连接的等待时间(秒)
+    """
+    pool = engine.pool
+    stats: dict[str, Any] = {}
+    if hasattr(pool, 'checkedout'):
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), checked_in=pool.checkedin(), overflow=max(pool.overflow(), 0))
+    wait = getattr(pool, 'stats', None)
+    if wait is not None:
+        stats.update(
+            waits=wait.waits, timeouts=wait.timeouts, wait_max=round(wait.wait_max, 6),
+            wait_avg=round(wait.wait_total / wait.waits, 6) if wait.waits else 0.0,
+        )
+    return stats
+
+
+def use_sqlite_pragmas(engine: AsyncEngine, pragmas: SqlitePragmas):
+    """
+    在每个新建立的 SQLite 连接上执行 PRAGMA
+    """
+    statements = pragmas.statements()
+
+    @sqlalchemy.event.listens_for(engine.sync_engine, 'connect')
+    def _(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
 def declare_database(config: DatabaseConfig | None = None, *, url: str | None = None, pool_size: int = 1,
-                     max_overflow: int = 15, autoflush: bool = True) -> DatabaseFactory:
+                     max_overflow: int = 15, autoflush: bool = True,
+                     sqlite: SqlitePragmas | None = SqlitePragmas()) -> DatabaseFactory:
     """
-    声明一个数据库连接工厂
+    声明一个数据库连接工厂, SQLite 连接默认使用 SqlitePragmas(WAL 等), sqlite=None 时不修改
     """
     if config is not None:
         url = config.url
         pool_size = config.pool_size
         max_overflow = config.max_overflow
         autoflush = config.autoflush
+        sqlite = config.sqlite
     assert url is not None, "url is required"
-    return async_sessionmaker(
-        create_async_engine(url) if url.startswith('sqlite') else
-        create_async_engine(
+    if not url.startswith('sqlite'):
+        engine = create_async_engine(
             url,
+            poolclass=TimedQueuePool,
             pool_size=pool_size,
             max_overflow=max_overflow,
             pool_timeout=30,
             pool_recycle=3600,
             pool_pre_ping=True,
-        ),
+        )
+    elif url.split('?')[0].endswith((':memory:', '://')):
+        # 内存 SQLite 必须使用默认的单连接池
+        engine = create_async_engine(url)
+    else:
+        engine = create_async_engine(url, poolclass=TimedQueuePool)
+    if url.startswith('sqlite') and sqlite is not None:
+        use_sqlite_pragmas(engine, sqlite)
+    return async_sessionmaker(
+        engine,
         class_=AsyncSession,
         autoflush=autoflush,
         expire_on_commit=False
     )
+
+
+# 各数据库单条语句的绑定参数上限(SQLite 3.32 之前为 999)
+MAX_PARAMS = {
+    'sqlite': 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999,
+    'postgresql': 32767,
+    'mysql': 65535,
+}
+
+
+class UpsertResult(BaseModel):
+    """
+    批量写入结果: inserted 为写入的行数(更新模式下包含被更新的行), skipped 为因冲突被跳过的行数;
+    MySQL 驱动总是开启 CLIENT.FOUND_ROWS, 冲突的行也计入影响行数, 无法区分插入与跳过, 此时 exact 为 False,
+    inserted 为批次行数, skipped 为 0, 两者都不可靠
+    """
+    inserted: int = 0
+    skipped: int = 0
+    exact: bool = True
+
+
+def _upsert_statement(dialect: str, table: sa.Table, rows: list[dict[str, Any]], update: list[str],
+                      index_elements: list[str] | None):
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+        stmt = insert(table).values(rows)
+        if not update:
+            return stmt.on_conflict_do_nothing()
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements or [column.name for column in table.primary_key],
+            set_={name: stmt.excluded[name] for name in update},
+        )
+    if dialect == 'mysql':
+        stmt = mysql_insert(table).values(rows)
+        # 没有需要更新的列时用主键赋值为自身, 冲突的行不做修改
+        names = update or [column.name for column in table.primary_key]
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in names})
+    raise ValueError(f"bulk_upsert does not support dialect: {dialect}")
+
+
+async def bulk_upsert(session: AsyncSession, model: Any, rows: Iterable[dict[str, Any]], *,
+                      update: Iterable[str] = (), index_elements: Iterable[str] | None = None,
+                      max_params: int | None = None) -> UpsertResult:
+    """
+    批量插入, 主键/唯一键冲突的行跳过(update 为空)或更新 update 中的列(冲突目标为 index_elements, 默认主键)
+    按数据库绑定参数上限自动分批, 在当前事务中执行, 由调用方提交; 所有行的字段必须一致
+    """
+    rows = list(rows)
+    result = UpsertResult()
+    if not rows:
+        return result
+    table: sa.Table = getattr(model, '__table__', model)
+    dialect = session.bind.dialect.name
+    update = list(update)
+    index_elements = list(index_elements) if index_elements is not None else None
+    chunk_size = max((max_params or MAX_PARAMS.get(dialect, 999)) // len(rows[0]), 1)
+    result.exact = dialect != 'mysql'
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        cursor = await session.execute(_upsert_statement(dialect, table, chunk, update, index_elements))
+        # MySQL 的影响行数包含冲突的行(更新的行计为 2), 见 UpsertResult
+        written = min(max(cursor.rowcount, 0), len(chunk))
+        result.inserted += written
+        result.skipped += len(chunk) - written
+    return result
+
+
+class InvalidCursor(ValueError):
+    def __str__(self) -> str:
+        return "Invalid cursor"
+
+
+class Pagination:
+    """
+    游标(keyset)分页: 按 columns 排序, 下一页从上一页最后一行的键值之后开始(WHERE (a, b) > (:a, :b)),
+    不使用 OFFSET, 翻到多深都只扫描一页的数据
+    游标是最后一行键值的 base64 编码, 对客户端不透明; columns 的组合需要唯一(通常以主键结尾)
+    游标无法解析时抛出 InvalidCursor, 由视图转换为 400 响应
+    """
+    def __init__(self, *columns: sa.ColumnElement[Any], limit: int = 100, max_limit: int = 1000, descending: bool = False) -> None:
+        assert columns, "at least one column is required"
+        self.columns = columns
+        self.limit = limit
+        self.max_limit = max_limit
+        self.descending = descending
+
+    @staticmethod
+    def encode_cursor(values: Sequence[Any]) -> str:
+        data = jsonlib.dumps(list(values), ensure_ascii=False, separators=(',', ':'), default=str).encode()
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+    def decode_cursor(self, cursor: str) -> list[Any]:
+        try:
+            values = jsonlib.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            raise InvalidCursor(cursor)
+        return values
+
+    def apply(self, statement: sa.Select, cursor: str | None = None, limit: int | None = None) -> sa.Select:
+        """
+        为查询加上游标条件/排序/数量限制(多取一行用于判断是否还有下一页)
+        """
+        limit = max(1, min(limit or self.limit, self.max_limit))
+        if cursor:
+            values = self.decode_cursor(cursor)
+            if len(self.columns) == 1:
+                left, right = self.columns[0], values[0]
+            else:
+                left, right = sa.tuple_(*self.columns), sa.tuple_(*values)
+            statement = statement.where(left < right if self.descending else left > right)
+        order = [column.desc() if self.descending else column.asc() for column in self.columns]
+        return statement.order_by(*order).limit(limit + 1)
+
+    def _key(self, row: Any) -> list[Any]:
+        if isinstance(row, Mapping):
+            return [row[column.key] for column in self.columns]
+        return [getattr(row, column.key) for column in self.columns]
+
+    def page(self, rows: Sequence[Any], limit: int | None = None) -> dict[str, Any]:
+        """
+        将 apply 后查询得到的行整理为 {'items': [...], 'next': 下一页游标或 None}
+        """
+        limit = max(1, min(limit or self.limit, self.max_limit))
+        items = list(rows[:limit])
+        cursor = self.encode_cursor(self._key(items[-1])) if len(rows) > limit and items else None
+        return {'items': items, 'next': cursor}
+
+
+
+async def stream_rows(session: AsyncSession, stmt: sa.Executable, *, partition: int = 1000,
+                      tuples: bool = False) -> AsyncIterator[list[dict[str, Any]] | list[tuple]]:
+    """
+    以 Core 查询逐批读取(每批 partition 行), 返回字典(列名只计算一次)或元组, 不创建 ORM 对象;
+    stmt 应查询列或表(例如 sa.select(Model.__table__)), 而不是 ORM 实体
+    """
+    result = await session.stream(stmt.execution_options(yield_per=partition))
+    keys = tuple(result.keys())
+    async for rows in result.partitions(partition):
+        if tuples:
+            yield [tuple(row) for row in rows]
+        else:
+            yield [dict(zip(keys, row)) for row in rows]
+
+
+async def fetch_rows(session: AsyncSession, stmt: sa.Executable, *, partition: int = 1000,
+                     tuples: bool = False) -> list[dict[str, Any]] | list[tuple]:
+    """
+    读取 stream_rows 的全部结果
+    """
+    rows = []
+    async for chunk in stream_rows(session, stmt, partition=partition, tuples=tuples):
+        rows.extend(chunk)
+    return rows
@@ -4,7 +4,14 @@ import httpx
 from typing import IO, Any, Callable, Mapping, MutableMapping, Optional, Sequence, Tuple, TypeVar, Iterable, AsyncIterable
 from ssl import SSLError
 from anyio import EndOfStream
+from email.utils import parsedate_to_datetime
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from .httpcache import ResponseCache, parse_jsonrpc, is_idempotent, rebuild_response
+from .logger import create_logger
 import asyncio
+import random
 import time
 
 USE_CLIENT_DEFAULT = httpx.USE_CLIENT_DEFAULT
@@ -38,28 +45,168 @@ CookiesType = httpx.Cookies | http.cookiejar.CookieJar | dict[str, str] | list[T
 AuthTypes = httpx.Auth | Callable[[httpx.Request], httpx.Request] | None
 
 
+class TokenBucket:
+    """
+    异步令牌桶: 每 period 秒补充 rate 个令牌, 最多累积 burst 个
+
+    等待者按 FIFO 顺序获取令牌, 不会出现多个等待者同时被唤醒的情况
+    """
+    def __init__(self, rate: int = 20, period: float = 1.0, burst: int | None = None):
+        if rate <= 0 or period <= 0:
+            raise ValueError("rate and period must be positive")
+        self._interval = period / rate
+        self._capacity = float(burst if burst is not None else rate)
+        self._tokens = self._capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) / self._interval)
+        self._updated_at = now
+
+    async def acquire(self):
+        """
+        获取一个令牌, 令牌不足时按排队顺序等待
+        """
+        # asyncio.Lock 按 FIFO 顺序唤醒, 持锁等待即可保证公平
+        async with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * self._interval)
+                self._refill(time.monotonic())
+            self._tokens -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
 class AsyncLimiter:
-    def __init__(self, limits: int = 20, period: float = 1.0):
+    """
+    异步限频器: 令牌桶控制速率(每 period 秒最多 limits 次), 信号量控制并发数(concurrency)
+
+    默认 burst=1, 请求按 period / limits 的间隔均匀放行, 任意 period 时间窗口内都不会超过 limits 次
+    """
+    def __init__(self, limits: int = 20, period: float = 1.0, concurrency: int | None = None, burst: int = 1):
         self._limits = limits
         self._period = period
-        self._tokens = limits
-        self._updated_at = time.monotonic()
+        self._bucket = TokenBucket(limits, period, burst)
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
 
     async def _acquire(self):
-        now = time.monotonic()
-        if now - self._updated_at > self._period:
-            self._tokens = self._limits
-            self._updated_at = now
-        if self._tokens > 0:
-            self._tokens -= 1
-            return
-        await asyncio.sleep(self._period + self._updated_at - now)
-        self._tokens -= 1
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            await self._bucket.acquire()
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    async def __aenter__(self):
+        await self._acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self._release()
+
+
+# GCRA 预约: 每次调用占用一个 interval 的时间槽, 返回需要等待的微秒数
+# 使用 Redis 服务器时间, 多个进程/容器之间不依赖本地时钟
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+redis.call('SET', KEYS[1], string.format('%d', new_tat), 'PX', math.ceil((new_tat - now) / 1000) + 1000)
+local wait = tat - tolerance - now
+if wait < 0 then
+    wait = 0
+end
+return wait
+"""
+
+
+class RedisLimiter:
+    """
+    分布式限频器: 通过 Redis Lua 脚本(GCRA)让所有进程共享同一份速率预算(每 period 秒 limits 次)
+
+    Redis 不可用时退回本地令牌桶(fallback), 并在 retry_after 秒后重新尝试 Redis;
+    redis 可以传入返回 Redis 的函数, 第一次限频时才调用(不提前创建 Redis 连接)
+    """
+    def __init__(
+        self,
+        redis: Redis | Callable[[], Redis],
+        key: str = 'rate-limit:default',
+        limits: int = 20,
+        period: float = 1.0,
+        concurrency: int | None = None,
+        burst: int = 1,
+        fallback: TokenBucket | None = None,
+        timeout: float = 1.0,
+        retry_after: float = 30.0,
+    ):
+        self._key = key
+        self._interval = int(period / limits * 1_000_000)
+        self._tolerance = int(self._interval * (burst - 1))
+        self._redis = redis
+        self._script = None
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self._fallback = fallback or TokenBucket(limits, period, burst)
+        self._timeout = timeout
+        self._retry_after = retry_after
+        self._disabled_until = 0.0
+        self._logger = create_logger('fetch')
+
+    @property
+    def distributed(self) -> bool:
+        """
+        当前是否使用 Redis 共享预算
+        """
+        return time.monotonic() >= self._disabled_until
+
+    async def _reserve(self) -> float | None:
+        if not self.distributed:
+            return None
+        try:
+            if self._script is None:
+                redis = self._redis if isinstance(self._redis, Redis) else self._redis()
+                self._script = redis.register_script(GCRA_SCRIPT)
+            wait = await asyncio.wait_for(self._script(keys=[self._key], args=[self._interval, self._tolerance]), self._timeout)
+            return int(wait) / 1_000_000
+        except (RedisError, OSError, asyncio.TimeoutError) as e:
+            if self.distributed:
+                self._logger.warning(f"Redis limiter unavailable, fallback to local limiter: {e!r}")
+            self._disabled_until = time.monotonic() + self._retry_after
+            return None
+
+    async def _acquire(self):
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            wait = await self._reserve()
+            if wait is None:
+                await self._fallback.acquire()
+            elif wait > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._release()
+            raise
 
     def _release(self):
-        self._tokens += 1
-        if self._tokens > self._limits:
-            self._tokens = self._limits
+        if self._semaphore is not None:
+            self._semaphore.release()
 
     async def __aenter__(self):
         await self._acquire()
@@ -69,6 +216,9 @@ class AsyncLimiter:
         self._release()
 
 
+Limiter = AsyncLimiter | RedisLimiter
+
+
 class SchemeAuth(httpx.Auth):
     def __init__(self, scheme: str, token: str):
         self._scheme = scheme
@@ -94,16 +244,132 @@ class RetryOverlimit(Exception):
         return "Retry over limit"
 
 
+class CircuitOpen(Exception):
+    def __init__(self, host: str, retry_in: float) -> None:
+        self.host = host
+        self.retry_in = retry_in
+
+    def __str__(self) -> str:
+        return f"Circuit open for {self.host}, retry in {self.retry_in:.1f}s"
+
+
+def parse_retry_after(response: httpx.Response) -> float | None:
+    """
+    解析 Retry-After 响应头(秒数或 HTTP 日期)
+    """
+    value = response.headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy(BaseModel):
+    retries: int = 3  # 最多尝试次数(含第一次)
+    backoff: float = 0.5  # 退避基准时间(秒), 第 n 次重试最多等待 backoff * 2^n
+    max_backoff: float = 30.0
+    statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})  # 需要重试的响应状态码
+    max_retry_after: float = 60.0  # Retry-After 的最大等待时间
+
+    def delay(self, attempt: int, response: httpx.Response | None = None) -> float:
+        """
+        第 attempt 次失败后的等待时间: 优先使用 Retry-After, 否则为带完全抖动的指数退避
+        """
+        if response is not None and (retry_after := parse_retry_after(response)) is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    单个上游主机的熔断器
+
+    连续 failure_threshold 个请求失败(重试用尽, 429 限流不算失败)后断开(直接拒绝请求), recovery_timeout 秒后进入半开状态,
+    每 recovery_timeout 秒只放行一个探测请求, 探测成功则恢复, 失败则继续断开
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> None:
+        self._threshold = failure_threshold
+        self._timeout = recovery_timeout
+        self._failures = 0
+        self._state = self.CLOSED
+        self._probe_at = 0.0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() >= self._probe_at:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def retry_in(self) -> float:
+        return max(self._probe_at - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        if self._state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if now < self._probe_at:
+            return False
+        # 半开: 放行一个探测请求, 在其结束前其他请求继续被拒绝
+        self._state = self.HALF_OPEN
+        self._probe_at = now + self._timeout
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._state = self.CLOSED
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self._threshold:
+            self._state = self.OPEN
+            self._probe_at = time.monotonic() + self._timeout
+
+
 class AsyncLimitClient(httpx.AsyncClient):
-    def __init__(self, timeout: int = 60, limits: int = 8, sleeps: float = 1, retries: int = 3, auth_value: str | None = None, auth_schema: str = 'bearer', **kwargs):
+    def __init__(self, timeout: int = 60, limits: int = 8, sleeps: float = 1, retries: int = 3, auth_value: str | None = None, auth_schema: str = 'bearer',
+                 limiter: Limiter | None = None, cache: ResponseCache | None = None, coalesce: bool = False,
+                 retry: RetryPolicy | None = None, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 http2: bool = False, connections: int | None = None, streams: int | None = None, **kwargs):
+        """
+        :param limits: 每 sleeps 秒最多请求次数, HTTP/1.1 模式下同时也是连接数和并发数
+        :param http2: 启用 HTTP/2, 多个请求以流的形式复用少量连接
+        :param connections: 连接数(HTTP/2 默认 2, HTTP/1.1 默认 limits)
+        :param streams: HTTP/2 模式下同时进行的请求(流)数量, 默认 100
+        """
+        if http2:
+            connections = connections or 2
+            concurrency = streams or 100
+        else:
+            connections = connections or limits
+            concurrency = limits
         super().__init__(
             timeout=timeout,
-            limits=httpx.Limits(max_keepalive_connections=limits, max_connections=limits),
+            limits=httpx.Limits(max_keepalive_connections=connections, max_connections=connections),
+            http2=http2,
             **kwargs
         )
-        self._sleep = sleeps
-        self._retries = retries
-        self._limiter = AsyncLimiter(limits=limits, period=sleeps)
+        self._retry = retry or RetryPolicy(retries=retries)
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._logger = create_logger('fetch')
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._limiter = limiter or AsyncLimiter(limits=limits, period=sleeps, concurrency=concurrency)
+        self._cache = cache
+        self._coalesce = coalesce
+        self._inflight: dict[str, asyncio.Future[tuple[int, list[tuple[str, str]], bytes]]] = {}
+        self.coalesce_leaders = 0  # 实际发出的可合并请求数
+        self.coalesced = 0  # 被合并(节省)的请求数
         self._auth_scheme = auth_schema
         self._auth_value = auth_value
         if self._auth_value:
@@ -112,6 +378,35 @@ class AsyncLimitClient(httpx.AsyncClient):
             else:
                 self._auth = SchemeAuth(auth_schema, auth_value)
 
+    @property
+    def limiter(self) -> Limiter:
+        return self._limiter
+
+    def use_limiter(self, limiter: Limiter):
+        """
+        替换限频器(例如切换为多进程共享的 RedisLimiter)
+        """
+        self._limiter = limiter
+
+    def breaker(self, host: str) -> CircuitBreaker | None:
+        """
+        获取主机对应的熔断器(failure_threshold 为 0 时不熔断)
+        """
+        if self._failure_threshold <= 0:
+            return None
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(self._failure_threshold, self._recovery_timeout)
+        return self._breakers[host]
+
+    @property
+    def cache(self) -> ResponseCache | None:
+        return self._cache
+
+    def use_cache(self, cache: ResponseCache | None):
+        """
+        启用(或传入 None 关闭)幂等请求的响应缓存
+        """
+        self._cache = cache
 
     async def send(self,
         request: httpx.Request,
@@ -128,10 +423,93 @@ class AsyncLimitClient(httpx.AsyncClient):
                 auth = ParamAuth(auth_scheme.removeprefix('param:').strip(), auth)
             else:
                 auth = SchemeAuth(auth_scheme, auth)
-        for _ in range(self._retries):
+        if not self._coalesce or stream:
+            return await self._send(request, stream=stream, auth=auth, follow_redirects=follow_redirects)
+        call = parse_jsonrpc(request)
+        key = ResponseCache.key(request, call) if is_idempotent(request, call) else None
+        if key is None:
+            return await self._send(request, stream=stream, auth=auth, follow_redirects=follow_redirects)
+
+        # 相同请求正在进行中, 等待并共享其结果
+        if (future := self._inflight.get(key)) is not None:
+            try:
+                status, headers, content = await asyncio.shield(future)
+                self.coalesced += 1
+                return rebuild_response(request, status, headers, content, call)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 发起者被取消, 由当前请求自行发送
+                return await self.send(request, stream=stream, auth=auth, follow_redirects=follow_redirects)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        self.coalesce_leaders += 1
+        try:
+            response = await self._send(request, stream=stream, auth=auth, follow_redirects=follow_redirects)
+            future.set_result((response.status_code, list(response.headers.items()), response.content))
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有等待者时避免 "exception was never retrieved" 警告
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _cache_lookup(self, cache: ResponseCache, request: httpx.Request) -> httpx.Response | None:
+        # 缓存存储不可用(例如 Redis 故障)时视为未命中, 不影响请求
+        try:
+            return await cache.lookup(request)
+        except Exception as e:
+            self._logger.warning(f"Response cache lookup failed: {e!r}")
+            return None
+
+    async def _cache_store(self, cache: ResponseCache, request: httpx.Request, response: httpx.Response):
+        # 写入缓存失败时只记录日志, 已成功的响应照常返回
+        try:
+            await cache.store(request, response)
+        except Exception as e:
+            self._logger.warning(f"Response cache store failed: {e!r}")
+
+    async def _send(self,
+        request: httpx.Request,
+        *,
+        stream: bool,
+        auth: AuthTypes | UseClientDefault,
+        follow_redirects: bool | UseClientDefault,
+    ) -> httpx.Response:
+        cache = self._cache if not stream else None
+        if cache is not None and (response := await self._cache_lookup(cache, request)) is not None:
+            return response
+        breaker = self.breaker(request.url.netloc.decode())
+        # 熔断按逻辑请求计数: 只在发起前检查一次, 重试结束后记录一次结果
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpen(request.url.host, breaker.retry_in)
+        # 5xx 只对幂等请求重试(请求可能已被处理), 429 表示请求未被处理, 总是可以重试
+        idempotent = is_idempotent(request, parse_jsonrpc(request))
+        for attempt in range(self._retry.retries):
             try:
                 async with self._limiter:
-                    return await super().send(request, stream=stream, auth=auth, follow_redirects=follow_redirects)
+                    response = await super().send(request, stream=stream, auth=auth, follow_redirects=follow_redirects)
             except (httpx.RequestError, SSLError, EndOfStream):
-                await asyncio.sleep(self._sleep)
+                if attempt + 1 < self._retry.retries:
+                    await asyncio.sleep(self._retry.delay(attempt))
+                continue
+            if response.status_code not in self._retry.statuses:
+                if breaker is not None:
+                    breaker.record_success()
+                if cache is not None:
+                    await self._cache_store(cache, request, response)
+                return response
+            if attempt + 1 >= self._retry.retries or not (idempotent or response.status_code == 429):
+                # 429 是上游限流而不是故障, 按 Retry-After 退避即可, 不计入熔断
+                if breaker is not None and response.status_code != 429:
+                    breaker.record_failure()
+                return response
+            await response.aclose()
+            await asyncio.sleep(self._retry.delay(attempt, response))
+        if breaker is not None:
+            breaker.record_failure()
         raise RetryOverlimit()
@@ -0,0 +1,350 @@
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Protocol
+from email.utils import parsedate_to_datetime
+from .cache import Cache
+import json as jsonlib
+import hashlib
+import time
+import httpx
+
+
+__all__ = [
+    "CacheStorage", "MemoryCacheStorage", "RedisCacheStorage", "ResponseCache",
+    "CacheRule", "JsonRpcCall", "JsonRpcRule", "jsonrpc_rule", "parse_jsonrpc", "is_idempotent", "rebuild_response",
+]
+
+
+# 缓存响应时不保留的头(内容已被 httpx 解码, 长度会重新计算)
+_SKIP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+
+# 表示"当前链状态"的区块标签, 对应的结果随时可能变化
+_MUTABLE_BLOCK_TAGS = {'latest', 'pending', 'safe', 'finalized'}
+
+
+class JsonRpcCall:
+    """
+    解析后的单个 JSON-RPC 请求
+    """
+    __slots__ = ('id', 'method', 'params')
+
+    def __init__(self, id: Any, method: str, params: Any) -> None:
+        self.id = id
+        self.method = method
+        self.params = params
+
+    def canonical(self) -> bytes:
+        """
+        去掉 id 后的规范化请求体(相同调用不同 id 共享同一个缓存)
+        """
+        return jsonlib.dumps([self.method, self.params], sort_keys=True, separators=(',', ':')).encode()
+
+
+def parse_jsonrpc(request: httpx.Request) -> JsonRpcCall | None:
+    """
+    解析单个(非批量)的 JSON-RPC 请求, 不是 JSON-RPC 请求时返回 None
+    """
+    if request.method != 'POST' or 'json' not in request.headers.get('content-type', ''):
+        return None
+    try:
+        body = jsonlib.loads(request.content)
+    except (ValueError, httpx.RequestNotRead):
+        return None
+    if not isinstance(body, dict) or 'jsonrpc' not in body or not isinstance(body.get('method'), str):
+        return None
+    return JsonRpcCall(body.get('id'), body['method'], body.get('params', []))
+
+
+# 只读的 JSON-RPC 方法(重复调用不会产生副作用)
+_READ_METHODS = {
+    'eth_blockNumber', 'eth_chainId', 'net_version', 'web3_clientVersion', 'eth_syncing',
+    'eth_gasPrice', 'eth_maxPriorityFeePerGas', 'eth_feeHistory', 'eth_estimateGas', 'eth_call',
+}
+
+
+def is_idempotent(request: httpx.Request, call: JsonRpcCall | None = None) -> bool:
+    """
+    判断请求是否幂等(可合并/可重复发送), request.extensions['idempotent'] 可强制指定
+    """
+    if 'idempotent' in request.extensions:
+        return bool(request.extensions['idempotent'])
+    if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return True
+    if call is None:
+        return False
+    return call.method in _READ_METHODS or call.method.startswith('eth_get')
+
+
+def rebuild_response(request: httpx.Request, status: int, headers: Iterable[tuple[str, str]], content: bytes,
+                     call: JsonRpcCall | None = None) -> httpx.Response:
+    """
+    用已读取的响应数据为另一个请求构造响应(JSON-RPC 响应的 id 会替换为该请求的 id)
+    """
+    if call is not None:
+        body = jsonlib.loads(content)
+        if isinstance(body, dict):
+            body['id'] = call.id
+            content = jsonlib.dumps(body, separators=(',', ':')).encode()
+    headers = [(k, v) for k, v in headers if k.lower() not in _SKIP_HEADERS]
+    return httpx.Response(status, headers=headers, content=content, request=request)
+
+
+CacheRule = Callable[[httpx.Request, JsonRpcCall | None], float | None]
+
+
+def _fixed_block(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith('0x') and value not in _MUTABLE_BLOCK_TAGS
+
+
+def _block_number(value: Any) -> int | None:
+    try:
+        return int(value, 16) if _fixed_block(value) else None
+    except ValueError:
+        return None
+
+
+class JsonRpcRule:
+    """
+    以太坊 JSON-RPC 的缓存规则: 只缓存指定了固定区块号/区块哈希的请求;
+    区块号距最新区块不足 finality_depth 个(可能被重组)或最新区块未知时只缓存 recent_ttl 秒,
+    最新区块号从经过客户端的 eth_blockNumber / eth_getBlockByNumber 响应中获得
+    """
+    def __init__(self, ttl: float = 86400.0, finality_depth: int = 64, recent_ttl: float = 6.0) -> None:
+        self.ttl = ttl
+        self.finality_depth = finality_depth
+        self.recent_ttl = recent_ttl
+        self.head: int | None = None
+
+    def observe(self, call: JsonRpcCall, body: Any):
+        """
+        从响应中更新最新区块号
+        """
+        result = body.get('result') if isinstance(body, dict) else None
+        match call.method:
+            case 'eth_blockNumber':
+                number = _block_number(result)
+            case 'eth_getBlockByNumber' if isinstance(result, dict):
+                number = _block_number(result.get('number'))
+            case _:
+                number = None
+        if number is not None and (self.head is None or number > self.head):
+            self.head = number
+
+    def _block_ttl(self, value: Any) -> float | None:
+        number = _block_number(value)
+        if number is None:
+            return None
+        if self.head is None or number > self.head - self.finality_depth:
+            return self.recent_ttl
+        return self.ttl
+
+    def __call__(self, request: httpx.Request, call: JsonRpcCall | None) -> float | None:
+        if call is None:
+            return None
+        params = call.params if isinstance(call.params, list) else []
+        match call.method:
+            case 'eth_chainId' | 'net_version':
+                return self.ttl
+            case 'eth_getBlockByHash' | 'eth_getTransactionByBlockHashAndIndex':
+                return self.ttl
+            case 'eth_getBlockByNumber' | 'eth_getBlockTransactionCountByNumber':
+                return self._block_ttl(params[0]) if params else None
+            case 'eth_getLogs':
+                query = params[0] if params and isinstance(params[0], dict) else {}
+                if 'blockHash' in query:
+                    return self.ttl
+                if _fixed_block(query.get('fromBlock')):
+                    return self._block_ttl(query.get('toBlock'))
+                return None
+            case 'eth_call' | 'eth_getBalance' | 'eth_getCode' | 'eth_getStorageAt':
+                return self._block_ttl(params[-1]) if params else None
+            case _:
+                return None
+
+
+def jsonrpc_rule(ttl: float = 86400.0, finality_depth: int = 64, recent_ttl: float = 6.0) -> JsonRpcRule:
+    """
+    以太坊 JSON-RPC 的缓存规则(见 JsonRpcRule)
+    """
+    return JsonRpcRule(ttl, finality_depth, recent_ttl)
+
+
+class CacheStorage(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+
+class MemoryCacheStorage:
+    """
+    进程内 LRU 缓存
+    """
+    def __init__(self, maxsize: int = 1024) -> None:
+        self._maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+
+    async def get(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+
+class RedisCacheStorage:
+    """
+    使用项目的 Redis Cache 存储(多进程共享)
+    """
+    def __init__(self, cache: Cache, prefix: str = 'http-cache:') -> None:
+        self._cache = cache
+        self._prefix = prefix
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._cache.get(f'{self._prefix}{key}')
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        # Cache.set 的 float 过期时间单位为秒
+        await self._cache.set(f'{self._prefix}{key}', value, expire=float(ttl))
+
+
+def _cache_control(headers: httpx.Headers) -> dict[str, str | None]:
+    directives: dict[str, str | None] = {}
+    for part in headers.get('cache-control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def _header_ttl(response: httpx.Response) -> float | None:
+    """
+    根据响应头计算可缓存时间, 禁止缓存时返回 0, 未声明时返回 None
+    """
+    directives = _cache_control(response.headers)
+    if 'no-store' in directives or 'no-cache' in directives or 'private' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name):
+            try:
+                return max(float(directives[name]) - float(response.headers.get('age', 0)), 0)
+            except ValueError:
+                return 0
+    if expires := response.headers.get('expires'):
+        try:
+            return max(parsedate_to_datetime(expires).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return 0
+    return None
+
+
+class ResponseCache:
+    """
+    幂等请求的响应缓存
+
+    缓存键为 方法 + URL + 请求体哈希(JSON-RPC 请求忽略 id), 缓存时间由以下规则决定:
+    1. request.extensions['cache_ttl'] (单次请求指定, 0 为不缓存)
+    2. rules 中第一个返回非 None 的规则
+    3. GET/HEAD 请求的响应头 Cache-Control/Expires
+    响应头中的 no-store/no-cache/private/max-age 会限制以上任一规则的结果
+    """
+    def __init__(self, storage: CacheStorage | None = None, rules: Iterable[CacheRule] = (), max_body: int = 4 * 1024 * 1024) -> None:
+        self._storage = storage or MemoryCacheStorage()
+        self._rules = list(rules)
+        self._max_body = max_body
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def key(request: httpx.Request, call: JsonRpcCall | None = None) -> str | None:
+        """
+        计算请求的缓存键, 请求体不可读(流式)时返回 None
+        """
+        try:
+            body = call.canonical() if call is not None else request.content
+        except httpx.RequestNotRead:
+            return None
+        digest = hashlib.sha256(body).hexdigest()
+        return hashlib.sha256(f'{request.method} {request.url} {digest}'.encode()).hexdigest()
+
+    def _request_ttl(self, request: httpx.Request, call: JsonRpcCall | None) -> float | None:
+        if 'cache_ttl' in request.extensions:
+            return float(request.extensions['cache_ttl'])
+        for rule in self._rules:
+            ttl = rule(request, call)
+            if ttl is not None:
+                return ttl
+        return None
+
+    def _bypass(self, request: httpx.Request) -> bool:
+        directives = _cache_control(request.headers)
+        return 'no-store' in directives or 'no-cache' in directives
+
+    async def lookup(self, request: httpx.Request) -> httpx.Response | None:
+        if self._bypass(request):
+            return None
+        call = parse_jsonrpc(request)
+        ttl = self._request_ttl(request, call)
+        # 没有规则命中的非 GET/HEAD 请求不会被缓存, 无需查询存储
+        if ttl == 0 or (ttl is None and request.method not in ('GET', 'HEAD')):
+            return None
+        key = self.key(request, call)
+        data = await self._storage.get(key) if key is not None else None
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        meta, _, content = data.partition(b'\n')
+        meta = jsonlib.loads(meta)
+        response = rebuild_response(request, meta['status'], meta['headers'], content, call)
+        response.extensions['from_cache'] = True
+        return response
+
+    async def store(self, request: httpx.Request, response: httpx.Response) -> bool:
+        if response.status_code != 200:
+            return False
+        call = parse_jsonrpc(request)
+        body = None
+        if call is not None and len(response.content) <= self._max_body:
+            try:
+                body = jsonlib.loads(response.content)
+            except ValueError:
+                return False
+            # 规则可以从响应中获取信息(例如最新区块号)
+            for rule in self._rules:
+                observe = getattr(rule, 'observe', None)
+                if observe is not None:
+                    observe(call, body)
+        if 'no-store' in _cache_control(request.headers):
+            return False
+        ttl = self._request_ttl(request, call)
+        header_ttl = _header_ttl(response)
+        if ttl is None:
+            ttl = header_ttl if request.method in ('GET', 'HEAD') else None
+        elif header_ttl is not None:
+            ttl = min(ttl, header_ttl)
+        if not ttl:
+            return False
+        content = response.content
+        if len(content) > self._max_body:
+            return False
+        if call is not None:
+            # 不缓存错误和空结果(例如尚未打包的交易回执)
+            if not isinstance(body, dict) or 'error' in body or body.get('result') is None:
+                return False
+        key = self.key(request, call)
+        if key is None:
+            return False
+        headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS]
+        meta = jsonlib.dumps({'status': response.status_code, 'headers': headers}, separators=(',', ':')).encode()
+        await self._storage.set(key, meta + b'\n' + content, ttl)
+        self.stores += 1
+        return True
@@ -1,7 +1,13 @@
 import logging
+import logging.handlers
 from colorama import init, Fore, Style
 from typing_extensions import Annotated, Doc
+import json as jsonlib
+import datetime
+import socket
+import queue
 import sys
+import os
 
 
 init()
@@ -65,6 +71,164 @@ class Formatter(logging.Formatter):
         return f'[{Fore.LIGHTWHITE_EX}{record.name}{Style.RESET_ALL}][{levelname}][{record.asctime}]{prefix}{message}'
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    单行 JSON 日志格式(生产环境使用), 固定字段(主机/进程/static)在创建时预先序列化
+
+    通过 extra={'fields': {...}} 传入的结构化字段会合并到输出中
+    """
+    def __init__(self, index: bool = False, static: dict[str, str] | None = None) -> None:
+        super().__init__()
+        self._index = index
+        fields = {'host': socket.gethostname(), 'pid': os.getpid(), **(static or {})}
+        # 形如 {"host":"..","pid":1 , 每条日志只需拼接动态字段
+        self._prefix = jsonlib.dumps(fields, ensure_ascii=False, separators=(',', ':'))[:-1]
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.UTC).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if self._index:
+            data['at'] = f'{record.pathname}:{record.lineno}'
+        fields = getattr(record, 'fields', None)
+        if fields:
+            data.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return f'{self._prefix},{jsonlib.dumps(data, ensure_ascii=False, default=str, separators=(',', ':'))[1:]}'
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    将日志记录放入有界队列, 由后台线程格式化并写出到 target
+
+    队列已满时: policy='block' 等待空位; policy='drop' 丢弃并计数(任何级别都不等待, 不会阻塞事件循环),
+    dropped 为丢弃的总数, dropped_warnings 为其中 WARNING 及以上的数量
+    """
+    def __init__(self, log_queue: queue.Queue, target: logging.Handler, policy: str = 'drop') -> None:
+        super().__init__(log_queue)
+        self.target = target
+        self.policy = policy
+        self.dropped = 0
+        self.dropped_warnings = 0
+
+    def prepare(self, record: logging.LogRecord):
+        # 只合并消息参数, 格式化(颜色/异常堆栈)留给后台线程
+        record.msg = record.getMessage()
+        record.args = None
+        return (self.target, record)
+
+    def enqueue(self, item):
+        if self.policy == 'block':
+            self.queue.put(item)
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            if item[1].levelno >= logging.WARNING:
+                self.dropped_warnings += 1
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """
+    后台线程: 将队列中的日志记录交给各自的 target 处理
+    """
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+
+    def enqueue_sentinel(self):
+        # 队列已满时等待后台线程腾出空位(默认的 put_nowait 会抛出 queue.Full)
+        self.queue.put(self._sentinel)
+
+    def handle(self, item):
+        target, record = item
+        if record.levelno >= target.level:
+            target.handle(record)
+
+
+# create_logger 创建的 logger 及其输出 handler
+_handlers: dict[str, tuple[logging.Logger, logging.Handler]] = {}
+_queue: queue.Queue | None = None
+_listener: QueueListener | None = None
+_policy = 'drop'
+_json_static: dict[str, str] | None = None
+
+
+def _formatter(index: bool, ecosystem: bool) -> logging.Formatter:
+    if _json_static is not None:
+        return JsonFormatter(index=index, static=_json_static)
+    return Formatter(index=index, ecosystem=ecosystem)
+
+
+def use_json_format(static: dict[str, str] | None = None):
+    """
+    切换为 JSON 日志格式(已创建的 logger 一并切换), static 为每条日志都带上的固定字段
+    """
+    global _json_static
+    _json_static = dict(static or {})
+    for _, target in _handlers.values():
+        target.formatter = JsonFormatter(index=getattr(target.formatter, '_index', False), static=_json_static)
+
+
+def json_format_enabled() -> bool:
+    return _json_static is not None
+
+
+def _queue_handler(target: logging.Handler) -> QueueHandler:
+    assert _queue is not None
+    handler = QueueHandler(_queue, target, _policy)
+    handler.setLevel(target.level)
+    return handler
+
+
+def start_queue_logging(maxsize: int = 10000, policy: str = 'drop'):
+    """
+    开启队列日志模式: 日志的格式化与写出移到后台线程(已创建的 logger 一并切换)
+    """
+    global _queue, _listener, _policy
+    if _listener is not None:
+        return
+    if policy not in ('drop', 'block'):
+        raise ValueError(f"Unknown log queue policy: {policy}")
+    _queue = queue.Queue(maxsize)
+    _policy = policy
+    _listener = QueueListener(_queue)
+    _listener.start()
+    for logger, target in _handlers.values():
+        for handler in logger.handlers:
+            if handler is target:
+                logger.removeHandler(handler)
+                logger.addHandler(_queue_handler(target))
+
+
+def stop_queue_logging():
+    """
+    写出队列中剩余的日志并停止后台线程, 之后的日志恢复为同步输出
+    """
+    global _queue, _listener
+    if _listener is None:
+        return
+    dropped = warnings = 0
+    for logger, target in _handlers.values():
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler) and handler.target is target:
+                dropped += handler.dropped
+                warnings += handler.dropped_warnings
+                logger.removeHandler(handler)
+                logger.addHandler(target)
+    _listener.stop()
+    _queue = None
+    _listener = None
+    if dropped:
+        sys.stderr.write(f"[logger] {dropped} log records dropped ({warnings} WARNING or above, log queue full)\n")
+
+
 def create_logger(
     name: str,
     level: int = logging.INFO,
@@ -75,7 +239,8 @@ def create_logger(
     if logger.handlers:
         return logger
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.formatter = Formatter(index=index, ecosystem=ecosystem)
-    logger.addHandler(console_handler)
+    console_handler.formatter = _formatter(index, ecosystem)
+    _handlers[name] = (logger, console_handler)
+    logger.addHandler(_queue_handler(console_handler) if _listener is not None else console_handler)
     logger.setLevel(level)
     return logger
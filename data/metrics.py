@@ -0,0 +1,186 @@
+from typing import Any, Awaitable, Callable, Iterable, Sequence
+import asyncio
+import bisect
+import math
+
+
+__all__ = ["Counter", "Gauge", "Histogram", "MetricsRegistry"]
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Collector = Callable[[], Awaitable[None]] | Callable[[], None]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return f'{{{",".join(pairs)}}}' if pairs else ''
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], Any] = {}
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        self._values.clear()
+
+    def samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # [各桶计数(不累加), 总和, 总数]
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f'{self.name}_bucket{labels} {count}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {count}'
+
+
+class MetricsRegistry:
+    """
+    指标注册表, 以 Prometheus 文本格式导出
+    """
+    def __init__(self, prefix: str = '') -> None:
+        self._prefix = prefix
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Collector] = []
+
+    def _get_or_create(self, cls: type[_Metric], name: str, *args, **kwargs):
+        name = f'{self._prefix}{name}'
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as {metric.type}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def collector(self, func: Collector) -> Collector:
+        """
+        注册采集函数, 每次导出前调用(用于刷新 Gauge 等瞬时值)
+        """
+        self._collectors.append(func)
+        return func
+
+    async def render(self) -> str:
+        for collector in self._collectors:
+            result = collector()
+            if asyncio.iscoroutine(result):
+                await result
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # 丢弃请求头
+            while (line := await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode(errors='ignore').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, content_type = '200 OK', 'text/plain; version=0.0.4; charset=utf-8'
+                body = (await self.render()).encode()
+            else:
+                status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'not found\n'
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 9109) -> asyncio.Server:
+        """
+        启动本地 HTTP 指标服务(GET /metrics)
+        """
+        return await asyncio.start_server(self._handle, host, port)
@@ -3,6 +3,7 @@ from aio_pika import RobustConnection, RobustChannel, RobustExchange, RobustQueu
 from pydantic import BaseModel, Field
 from typing import TypeVar, TypeVarTuple, Unpack, Any, overload, AsyncGenerator, Generator, Tuple
 import json as jsonlib
+import datetime
 import asyncio
 import yarl
 
@@ -48,7 +49,8 @@ class RabbitMQ:
         user: str | None = None,
         password: str | None = None,
         exchange: str | None = None,
-        loop: asyncio.AbstractEventLoop | None = None
+        loop: asyncio.AbstractEventLoop | None = None,
+        timeout: float | None = None,
     ) -> None:
         if config is None:
             self._url = aio_pika.connection.make_url(
@@ -68,9 +70,35 @@ class RabbitMQ:
         self._channel: aio_pika.RobustChannel | None = None
         self._exchange: aio_pika.RobustExchange | None = None
         self._exchange_name = exchange
-        self._init_task: asyncio.Task[None] = self._loop.create_task(self.ensure_connection())
-        self._init_task.set_name(f"RabbitMQ.ensure_connection.{id(self):#018x}")
+        # 首次使用时才建立连接, timeout 为每次等待连接的最长时间
+        self._timeout = timeout
+        self._init_task: asyncio.Task[None] | None = None
 
+    @property
+    def connected(self) -> bool:
+        return self._channel is not None and not self._client.is_closed
+
+    async def connect(self) -> None:
+        """
+        等待连接建立(只发起一次, 失败后下次调用重新发起), 超过 timeout 抛出 TimeoutError
+        """
+        task = self._init_task
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            self._init_task = self._loop.create_task(self.ensure_connection())
+            self._init_task.set_name(f"RabbitMQ.ensure_connection.{id(self):#018x}")
+        if self._timeout:
+            # shield: 超时只放弃本次等待, 连接继续进行供后续调用复用
+            await asyncio.wait_for(asyncio.shield(self._init_task), self._timeout)
+        else:
+            await self._init_task
+
+    async def ping(self) -> None:
+        """
+        健康检查: 连接不可用时抛出异常
+        """
+        await self.connect()
+        if self._client.is_closed:
+            raise ConnectionError("rabbitmq connection is closed")
 
     async def ensure_connection(self) -> None:
         """
@@ -78,9 +106,10 @@ class RabbitMQ:
         """
         if self._channel is None:
             await self._client.connect()
-            self._channel = await self._client.channel()
+            channel = await self._client.channel()
             if self._exchange_name is not None:
-                self._exchange = await self._channel.get_exchange(self._exchange_name)
+                self._exchange = await channel.get_exchange(self._exchange_name)
+            self._channel = channel
 
     @overload
     async def send(self, queue: str, message: ModelType, **dump_kws) -> None:
@@ -110,13 +139,19 @@ class RabbitMQ:
         ...
 
     async def send(self, queue: str, message: Any, **dump_kws) -> None:
-        await self._init_task
+        await self.connect()
         delivery_mode = dump_kws.pop("delivery_mode", None)
         if delivery_mode is not None:
             try:
                 delivery_mode = int(delivery_mode)
             except:
                 delivery_mode = None
+        priority = dump_kws.pop("priority", None)
+        if priority is not None:
+            try:
+                priority = int(priority)
+            except:
+                priority = None
         if isinstance(message, BaseModel):
             data = message.model_dump_json(**dump_kws).encode()
         elif isinstance(message, str):
@@ -135,7 +170,9 @@ class RabbitMQ:
                 body=data,
                 content_type="application/json",
                 content_encoding="utf-8",
-                delivery_mode=delivery_mode
+                delivery_mode=delivery_mode,
+                priority=priority,
+                timestamp=datetime.datetime.now(datetime.UTC)
             ),
             queue_name
         )
@@ -183,15 +220,22 @@ class RabbitMQ:
         """
         ...
 
-    async def receive(self, queue_name: str, model: type[_Type] | type[Tuple[Unpack[_TypeGroup]]] | None = None, *, strict: bool | None = None, context: dict[str, Any] | None = None):
-        await self._init_task
+    async def receive(self, queue_name: str, model: type[_Type] | type[Tuple[Unpack[_TypeGroup]]] | None = None, *, strict: bool | None = None, context: dict[str, Any] | None = None,
+                      prefetch: int | None = None, max_priority: int | None = None):
+        await self.connect()
         async with self._client.channel() as channel:
             exchange_name, queue_name = queue_name.split("/", 1) if "/" in queue_name else (None, queue_name)
-            # await self._channel.set_qos(prefetch_count=1)
+            # 限制未确认消息数量, 否则服务端会把所有消息推送过来, 优先级也就失去了意义
+            if prefetch:
+                await channel.set_qos(prefetch_count=prefetch)
 
             # 声明一个命名队列还是临时队列(带有交换器的均为临时队列)
             if queue_name and exchange_name is None:
-                queue: aio_pika.robust_queue.RobustQueue = await channel.get_queue(queue_name, ensure=True)
+                if max_priority:
+                    # 优先级队列(注意: 已存在的队列参数不一致时服务端会拒绝声明)
+                    queue = await channel.declare_queue(queue_name, durable=True, arguments={"x-max-priority": max_priority})
+                else:
+                    queue: aio_pika.robust_queue.RobustQueue = await channel.get_queue(queue_name, ensure=True)
             else:
                 queue = await channel.declare_queue("", exclusive=True)
 
@@ -226,5 +270,18 @@ class RabbitMQ:
                     message: aio_pika.IncomingMessage
                     yield jsonlib.loads(message.body), message
 
+    async def queue_depth(self, queue_name: str) -> int:
+        """
+        获取队列中待消费的消息数量(被动声明, 队列不存在时抛出异常)
+        """
+        await self.connect()
+        async with self._client.channel() as channel:
+            queue = await channel.declare_queue(queue_name, passive=True)
+            return queue.declaration_result.message_count
+
     async def close(self) -> None:
+        if self._init_task is None:
+            return
+        if not self._init_task.done():
+            self._init_task.cancel()
         await self._client.close()
@@ -0,0 +1,247 @@
+from collections import deque
+from typing import Any, Iterable
+from .fetch import AsyncLimitClient, CircuitBreaker
+from .httpcache import JsonRpcCall, is_idempotent
+from .logger import create_logger
+import itertools
+import asyncio
+import time
+import httpx
+
+
+__all__ = ["RpcEndpoint", "RpcPool", "RpcError", "web3_provider", "LazyWeb3"]
+
+
+class RpcError(ConnectionError):
+    """
+    所有节点都请求失败(继承 ConnectionError, web3 的 is_connected 会将其视为未连接并返回 False)
+    """
+    def __init__(self, message: str, errors: list[BaseException] | None = None) -> None:
+        super().__init__(message)
+        self.errors = errors or []
+
+
+class RpcEndpoint:
+    """
+    单个 RPC 节点的统计信息(EWMA 延迟/错误率, 以及用于估算 p95 的最近延迟样本)
+    """
+    def __init__(self, url: str, alpha: float = 0.2, samples: int = 200) -> None:
+        self.url = url
+        self.host = httpx.URL(url).netloc.decode()
+        self._alpha = alpha
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self._samples: deque[float] = deque(maxlen=samples)
+
+    def record(self, latency: float, ok: bool):
+        self.requests += 1
+        if ok:
+            self._samples.append(latency)
+            self.latency = latency if self.latency is None else self.latency + self._alpha * (latency - self.latency)
+        else:
+            self.errors += 1
+        self.error_rate += self._alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+    @property
+    def p95(self) -> float | None:
+        if len(self._samples) < 20:
+            return None
+        samples = sorted(self._samples)
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def score(self, breaker: CircuitBreaker | None = None) -> float:
+        """
+        路由评分, 越小越好; 没有样本的节点优先被探测, 熔断中的节点排在最后
+        """
+        if breaker is not None and breaker.state == CircuitBreaker.OPEN:
+            return float('inf')
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + self.inflight * 0.1) * (1 + 4 * self.error_rate)
+
+
+class RpcPool:
+    """
+    多节点 JSON-RPC 连接池
+
+    每次调用选择评分最优的节点, 失败时依次切换到下一个节点;
+    只读调用在超过主节点 p95 延迟后向第二个节点发出对冲请求, 取先返回的结果,
+    对冲请求数受 hedge_ratio 限制(默认不超过总请求数的 10%)
+    """
+    def __init__(
+        self,
+        urls: Iterable[str],
+        client: AsyncLimitClient | None = None,
+        hedge: bool = True,
+        hedge_ratio: float = 0.1,
+        min_hedge_delay: float = 0.05,
+        default_hedge_delay: float = 1.0,
+    ) -> None:
+        self.endpoints = [RpcEndpoint(url) for url in urls if url]
+        if not self.endpoints:
+            raise ValueError("At least one RPC url is required")
+        self._client = client
+        self._own_client = client is None
+        self._hedge = hedge and len(self.endpoints) > 1
+        self._hedge_ratio = hedge_ratio
+        self._hedge_tokens = 1.0
+        self._min_hedge_delay = min_hedge_delay
+        self._default_hedge_delay = default_hedge_delay
+        self._ids = itertools.count(1)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._logger = create_logger('rpc')
+
+    @property
+    def client(self) -> AsyncLimitClient:
+        if self._client is None:
+            self._client = AsyncLimitClient()
+        return self._client
+
+    async def use_client(self, client: AsyncLimitClient):
+        """
+        使用外部(例如 Context 中共享限频预算)的请求客户端, 关闭之前自行创建的客户端
+        """
+        if client is self._client:
+            return
+        previous, own = self._client, self._own_client
+        self._client = client
+        self._own_client = False
+        if own and previous is not None:
+            await previous.aclose()
+
+    async def close(self):
+        if self._own_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def ranked(self) -> list[RpcEndpoint]:
+        client = self.client
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.score(client.breaker(endpoint.host)))
+
+    def _hedge_delay(self, endpoint: RpcEndpoint) -> float:
+        p95 = endpoint.p95
+        return max(p95 if p95 is not None else self._default_hedge_delay, self._min_hedge_delay)
+
+    def _take_hedge_token(self) -> bool:
+        if self._hedge_tokens >= 1:
+            self._hedge_tokens -= 1
+            return True
+        return False
+
+    async def _call(self, endpoint: RpcEndpoint, payload: dict[str, Any]) -> dict[str, Any]:
+        endpoint.inflight += 1
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(endpoint.url, json=payload)
+            response.raise_for_status()
+            data = response.json()
+        except asyncio.CancelledError:
+            # 对冲中被取消的请求不计入统计
+            raise
+        except Exception as e:
+            endpoint.record(time.perf_counter() - start, False)
+            self._logger.warning(f"RPC {payload['method']} failed on {endpoint.host}: {e!r}")
+            raise
+        else:
+            endpoint.record(time.perf_counter() - start, True)
+            return data
+        finally:
+            endpoint.inflight -= 1
+
+    async def _call_hedged(self, primary: RpcEndpoint, secondary: RpcEndpoint, payload: dict[str, Any]) -> dict[str, Any]:
+        """
+        先请求 primary, 超过其 p95 延迟仍未返回时(且有对冲预算)同时请求 secondary, 取先成功的结果;
+        primary 失败时直接改用 secondary
+        """
+        first = asyncio.ensure_future(self._call(primary, payload))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(primary))
+            if done or not self._take_hedge_token():
+                try:
+                    return await first
+                except Exception:
+                    return await self._call(secondary, payload)
+            self.hedges += 1
+            second = asyncio.ensure_future(self._call(secondary, payload))
+            pending.add(second)
+            errors: list[BaseException] = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    errors.append(task.exception())
+            raise errors[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def request(self, method: str, params: Any = None) -> dict[str, Any]:
+        """
+        发送 JSON-RPC 请求, 返回完整的响应对象(包含 result 或 error)
+        """
+        payload = {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params if params is not None else []}
+        self._hedge_tokens = min(self._hedge_tokens + self._hedge_ratio, 10.0)
+        endpoints = self.ranked()
+        request = httpx.Request('POST', endpoints[0].url)
+        hedge = self._hedge and is_idempotent(request, JsonRpcCall(payload['id'], method, payload['params']))
+        errors: list[BaseException] = []
+        index = 0
+        while index < len(endpoints):
+            try:
+                if hedge and index + 1 < len(endpoints):
+                    return await self._call_hedged(endpoints[index], endpoints[index + 1], payload)
+                return await self._call(endpoints[index], payload)
+            except Exception as e:
+                errors.append(e)
+            # 对冲失败时两个节点都已尝试过
+            index += 2 if hedge and index + 1 < len(endpoints) else 1
+        raise RpcError(f"RPC {method} failed on all endpoints", errors)
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                'host': endpoint.host,
+                'latency': endpoint.latency,
+                'p95': endpoint.p95,
+                'error_rate': endpoint.error_rate,
+                'requests': endpoint.requests,
+                'errors': endpoint.errors,
+                'inflight': endpoint.inflight,
+            }
+            for endpoint in self.endpoints
+        ]
+
+
+def web3_provider(pool: RpcPool):
+    """
+    创建使用 RpcPool 的 web3 异步 Provider(延迟导入 web3)
+    """
+    from web3.providers.async_base import AsyncJSONBaseProvider
+
+    class PooledProvider(AsyncJSONBaseProvider):
+        async def make_request(self, method, params):
+            return await pool.request(method, params)
+
+    return PooledProvider()
+
+
+class LazyWeb3:
+    """
+    使用 RpcPool 的 AsyncWeb3, 首次访问属性时才导入 web3 并创建实例(web3 的导入很慢)
+    """
+    def __init__(self, pool: RpcPool) -> None:
+        self._pool = pool
+        self._web3 = None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._web3 is None:
+            from web3 import AsyncWeb3
+            self._web3 = AsyncWeb3(web3_provider(self._pool))
+        return getattr(self._web3, name)
@@ -1,2 +1,3 @@
 from .request import Request, RequestMiddleware
+from .compress import CompressionMiddleware, PrecompressedAsset
 from .security import SecurityData, SecurityStatus
\ No newline at end of file
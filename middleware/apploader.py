@@ -1,38 +1,63 @@
 from typing import Any, Callable
 from data.logger import create_logger
 import importlib
+import resource
 import inspect
-import sys
+import time
 import os
+import settings
 
 logger = create_logger('AppLoader', index=False, ecosystem=False)
 
 
-def register_by(register_funcname: str, app: Any, extra_process: Callable[..., bool] | None = None):
-    apps_path = os.path.join(os.getcwd(), 'apps')
-    for app_name in os.listdir(apps_path):
+def _rss_mb() -> float:
+    # 进程峰值内存(Linux 下 ru_maxrss 单位为 KB)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def discover_apps(apps_path: str | None = None) -> list[str]:
+    """
+    列出需要加载的 App: apps 目录下的包, 排除 disable_ 前缀与 APPS_DISABLED, APPS_ENABLED 不为空时只加载其中的 App
+    """
+    apps_path = apps_path or os.path.join(os.getcwd(), 'apps')
+    names = []
+    for app_name in sorted(os.listdir(apps_path)):
         if app_name.startswith('disable_'): continue
         app_path = os.path.join(apps_path, app_name)
         if not os.path.isdir(app_path): continue
         if not os.path.exists(os.path.join(app_path, '__init__.py')): continue
-        sys.path.append(app_path)
+        if settings.APPS_ENABLED and app_name not in settings.APPS_ENABLED: continue
+        if app_name in settings.APPS_DISABLED: continue
+        names.append(app_name)
+    return names
+
+
+def register_by(register_funcname: str, app: Any, extra_process: Callable[..., bool] | None = None):
+    """
+    导入各个 App 并调用其 register_funcname 注册, 记录每个 App 的导入耗时与内存增长
+    """
+    total = time.perf_counter()
+    for app_name in discover_apps():
+        start, rss = time.perf_counter(), _rss_mb()
         try:
             module = importlib.import_module(f'apps.{app_name}')
             if not hasattr(module, register_funcname):
                 # logger.error(f"App: {app_name} does not have {register_funcname}")
                 continue
             module_func = getattr(module, register_funcname)
+            cost = f'{(time.perf_counter() - start) * 1000:.1f}ms, +{_rss_mb() - rss:.1f}MB'
             if extra_process and extra_process(module_func):
-                logger.info(f"Imported App: {app_name}")
+                logger.info(f"Imported App: {app_name} ({cost})")
             elif callable(module_func):
                 sig = inspect.signature(module_func)
                 params = sig.parameters.values()
                 if len(params) == 1 and list(params)[0].annotation == app.__class__:
                     module_func(app)
-                    logger.info(f"Imported App: {app_name}")
+                    logger.info(f"Imported App: {app_name} ({cost})")
                 else:
                     logger.error(f"App: {app_name} {register_funcname} signature error")
             else:
                 logger.error(f"App: {app_name} {register_funcname} type error")
         except Exception as e:
             logger.exception(f"Importing App: {app_name} Error: {e}")
+    logger.info(f"Imported Apps in {(time.perf_counter() - total) * 1000:.1f}ms (peak RSS {_rss_mb():.1f}MB)")
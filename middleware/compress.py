@@ -0,0 +1,303 @@
+from typing import Any, Callable, Iterable, Mapping
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import asyncio
+import hashlib
+import zlib
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+
+__all__ = ["CompressionMiddleware", "PrecompressedAsset", "negotiate", "available_encodings"]
+
+
+class _Codec:
+    """
+    压缩算法: compress 一次性压缩, stream 返回流式压缩器 (compress(data) 返回可立即发送的数据, finish() 返回结尾数据)
+    """
+    name = ''
+
+    def __init__(self, level: int, max_level: int) -> None:
+        self.level = level
+        self.max_level = max_level
+
+    def compress(self, data: bytes, level: int | None = None) -> bytes:
+        raise NotImplementedError
+
+    def stream(self) -> Any:
+        raise NotImplementedError
+
+
+class _GzipStream:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Gzip(_Codec):
+    name = 'gzip'
+
+    def compress(self, data: bytes, level: int | None = None) -> bytes:
+        compressor = zlib.compressobj(level or self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self) -> _GzipStream:
+        return _GzipStream(self.level)
+
+
+class _BrotliStream:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Brotli(_Codec):
+    name = 'br'
+
+    def compress(self, data: bytes, level: int | None = None) -> bytes:
+        return brotli.compress(data, quality=level or self.level)
+
+    def stream(self) -> _BrotliStream:
+        return _BrotliStream(self.level)
+
+
+class _ZstdStream:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Zstd(_Codec):
+    name = 'zstd'
+
+    def compress(self, data: bytes, level: int | None = None) -> bytes:
+        return zstandard.ZstdCompressor(level=level or self.level).compress(data)
+
+    def stream(self) -> _ZstdStream:
+        return _ZstdStream(self.level)
+
+
+def available_encodings() -> list[str]:
+    """
+    当前环境可用的压缩算法(按服务端偏好排序), br/zstd 需要安装 brotli/zstandard
+    """
+    return [name for name, module in (('br', brotli), ('zstd', zstandard), ('gzip', zlib)) if module is not None]
+
+
+def _codec(name: str, level: int | None = None) -> _Codec:
+    match name:
+        case 'br': return _Brotli(level or 4, 11)
+        case 'zstd': return _Zstd(level or 3, 19)
+        case 'gzip': return _Gzip(level or 6, 9)
+    raise ValueError(f"Unsupported encoding: {name}")
+
+
+def negotiate(accept_encoding: str, encodings: Iterable[str]) -> str | None:
+    """
+    根据 Accept-Encoding(含 q 值)从 encodings 中选择压缩算法, 同等 q 值时按 encodings 的顺序, 不压缩时返回 None
+    """
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    best, best_q = None, 0.0
+    for name in encodings:
+        q = accepted.get(name, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+# 默认压缩的内容类型(前缀匹配)
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'application/x-ndjson', 'application/problem+json', 'image/svg+xml',
+)
+
+
+def _weaken_etag(headers: MutableHeaders):
+    etag = headers.get('etag')
+    if etag is not None and not etag.startswith('W/'):
+        headers['etag'] = f'W/{etag}'
+
+
+class CompressionMiddleware:
+    """
+    纯 ASGI 响应压缩中间件, 根据 Accept-Encoding 协商 br/zstd/gzip
+
+    跳过: 已设置 Content-Encoding 的响应(例如 PrecompressedAsset)、不可压缩的内容类型、小于 minimum_size 的响应体;
+    一次性响应整体压缩, 流式响应(StreamingResponse/JsonStream)逐块压缩并立即发送;
+    压缩后的响应与原始响应字节不同, 强 ETag 改为弱 ETag(W/), 协商了压缩的 304 响应同样处理
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = 512, encodings: Iterable[str] | None = None,
+                 levels: Mapping[str, int] | None = None, compressible_types: Iterable[str] = COMPRESSIBLE_TYPES) -> None:
+        self.app = app
+        self._minimum_size = minimum_size
+        levels = levels or {}
+        self._codecs = {name: _codec(name, levels.get(name)) for name in (encodings or available_encodings())}
+        self._types = tuple(compressible_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        encoding = negotiate(headers.get('accept-encoding', ''), self._codecs)
+        if encoding is None or 'range' in headers:
+            await self.app(scope, receive, send)
+            return
+        codec = self._codecs[encoding]
+        start: Message | None = None
+        passthrough = False
+        stream = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, passthrough, stream
+            if message['type'] == 'http.response.start':
+                response_headers = Headers(raw=message.get('headers', []))
+                passthrough = (
+                    message['status'] < 200 or message['status'] in (204, 304)
+                    or 'content-encoding' in response_headers
+                    or not response_headers.get('content-type', '').startswith(self._types)
+                )
+                if passthrough:
+                    if message['status'] == 304:
+                        _weaken_etag(MutableHeaders(scope=message))
+                    await send(message)
+                else:
+                    # 等待第一块响应体再决定是否压缩
+                    start = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if start is not None:
+                response_headers = MutableHeaders(scope=start)
+                if not more_body and len(body) < self._minimum_size:
+                    await send(start)
+                    start = None
+                    passthrough = True
+                    await send(message)
+                    return
+                response_headers['content-encoding'] = encoding
+                response_headers.add_vary_header('Accept-Encoding')
+                _weaken_etag(response_headers)
+                if more_body:
+                    del response_headers['content-length']
+                    stream = codec.stream()
+                else:
+                    body = codec.compress(body)
+                    response_headers['content-length'] = str(len(body))
+                await send(start)
+                start = None
+                if stream is None:
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+            if more_body:
+                await send({'type': 'http.response.body', 'body': stream.compress(body), 'more_body': True})
+            else:
+                await send({'type': 'http.response.body', 'body': stream.compress(body) + stream.finish()})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class PrecompressedAsset:
+    """
+    预压缩的静态内容: 内容只读取/渲染一次, 用每种可用算法的最高压缩率各压缩一份缓存,
+    请求时按 Accept-Encoding 直接返回对应版本, 每个版本带有各自的强 ETag(内容哈希加压缩算法, 支持 If-None-Match 返回 304)
+    """
+    def __init__(self, loader: Callable[[], bytes], media_type: str, headers: Mapping[str, str] | None = None,
+                 encodings: Iterable[str] | None = None) -> None:
+        self._loader = loader
+        self.media_type = media_type
+        self._headers = dict(headers or {})
+        self._encodings = list(encodings or available_encodings())
+        self._variants: dict[str, bytes] = {}
+        self._task: asyncio.Future[None] | None = None
+        self.digest = ''
+
+    @classmethod
+    def from_file(cls, path: str, media_type: str, headers: Mapping[str, str] | None = None) -> 'PrecompressedAsset':
+        def loader() -> bytes:
+            with open(path, 'rb') as file:
+                return file.read()
+        return cls(loader, media_type, headers)
+
+    @classmethod
+    def from_template(cls, templates: Any, name: str, context: Mapping[str, Any] | None = None) -> 'PrecompressedAsset':
+        """
+        不依赖请求内容的 Jinja2 模板(templates 为 Jinja2Templates)
+        """
+        return cls(lambda: templates.get_template(name).render(**(context or {})).encode(), 'text/html; charset=utf-8')
+
+    def load(self):
+        data = self._loader()
+        variants = {'identity': data}
+        for name in self._encodings:
+            codec = _codec(name)
+            compressed = codec.compress(data, codec.max_level)
+            if len(compressed) < len(data):
+                variants[name] = compressed
+        self.digest = hashlib.sha256(data).hexdigest()[:32]
+        self._variants = variants
+
+    def etag(self, encoding: str | None = None) -> str:
+        """
+        指定压缩版本的 ETag(不同版本的字节不同, 强 ETag 不能相同)
+        """
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+
+    async def prepare(self):
+        """
+        在线程中加载并压缩(只执行一次), 服务启动时调用可避免第一个请求等待
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(asyncio.to_thread(self.load))
+        await asyncio.shield(self._task)
+
+    async def response(self, request: Request) -> Response:
+        await self.prepare()
+        encoding = negotiate(request.headers.get('accept-encoding', ''), [name for name in self._variants if name != 'identity'])
+        headers = {**self._headers, 'ETag': self.etag(encoding), 'Vary': 'Accept-Encoding'}
+        if headers['ETag'] in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        return Response(self._variants[encoding or 'identity'], media_type=self.media_type, headers=headers)
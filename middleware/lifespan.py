@@ -2,10 +2,12 @@ from contextlib import asynccontextmanager
 from typing import Any, Callable, NoReturn, Awaitable
 from fastapi import FastAPI
 from data import Context, rabbit, cache, db
+from data.logger import start_queue_logging, stop_queue_logging, use_json_format
 from .security import RS256Checker
 import logging
 import asyncio
 import settings
+import time
 
 
 logger = logging.getLogger('app')
@@ -16,6 +18,57 @@ LifespanCallable = Callable[..., Awaitable[None]] | Callable[..., Awaitable[NoRe
 # 公共列表区
 startup_list: list[LifespanCallable] = []
 shutdown_list: list[LifespanCallable] = []
+# 必须完成后服务才算就绪的启动任务
+required_startups: set[LifespanCallable] = set()
+# 预热任务(并行执行, 最多等待 settings.STARTUP_WARMUP_TIMEOUT 秒)
+warmup_list: list[LifespanCallable] = []
+
+
+class StartupTracker:
+    """
+    记录每个启动/预热任务的状态与耗时, 必须的启动任务完成且预热任务结束(或超时)后服务就绪
+    """
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.hooks: dict[str, dict[str, Any]] = {}
+        self.ready = False
+        self.ready_in: float | None = None
+        self.failed = False
+
+    async def run(self, kind: str, func: LifespanCallable, app: FastAPI):
+        # 不同模块中可能有同名的启动函数
+        name = f'{func.__module__}.{func.__qualname__}'
+        hook = self.hooks[name] = {'kind': kind, 'status': 'running', 'elapsed': None}
+        start = time.perf_counter()
+        try:
+            await func(app)
+            hook['status'] = 'done'
+        except asyncio.CancelledError:
+            hook['status'] = 'cancelled'
+            raise
+        except:
+            hook['status'] = 'failed'
+            raise
+        finally:
+            hook['elapsed'] = round(time.perf_counter() - start, 3)
+            logger.info(f"启动任务 {name}[{kind}] {hook['status']} ({hook['elapsed'] * 1000:.1f}ms)")
+
+    async def gate(self, required: list[asyncio.Task[None]], warmups: list[asyncio.Task[None]], timeout: float):
+        results = await asyncio.gather(*required, return_exceptions=True)
+        if any(isinstance(result, BaseException) for result in results):
+            self.failed = True
+            logger.error("必须的启动任务失败, 服务不会进入就绪状态")
+            return
+        if warmups:
+            _, pending = await asyncio.wait(warmups, timeout=max(timeout - (time.perf_counter() - self.started), 0))
+            for task in pending:
+                task.cancel()
+        self.ready = True
+        self.ready_in = round(time.perf_counter() - self.started, 3)
+        logger.info(f"服务就绪 ({self.ready_in * 1000:.1f}ms)")
+
+    def report(self) -> dict[str, Any]:
+        return {'ready': self.ready, 'failed': self.failed, 'ready_in': self.ready_in, 'hooks': self.hooks}
 
 
 def _startup_done(task: asyncio.Task[None]):
@@ -39,27 +92,64 @@ def _shutdown_done(task: asyncio.Task[None]):
 @asynccontextmanager
 async def lifespan_context(app: FastAPI):
     # Startup
+    if settings.LOG_FORMAT == 'json':
+        use_json_format({'service': 'server', 'env': settings.ENV})
+    if settings.LOG_QUEUE_SIZE > 0:
+        start_queue_logging(settings.LOG_QUEUE_SIZE, settings.LOG_QUEUE_POLICY)
     app.state.context = Context(
         cache=cache.RedisConfig(settings.CACHE_URL),
         databases={
-            key: db.DatabaseConfig(url)
+            key: db.DatabaseConfig(
+                url,
+                replicas=settings.DATABASE_REPLICAS.get(key),
+                read_routing=settings.DATABASE_READ_ROUTING,
+                sticky_window=settings.DATABASE_STICKY_WINDOW,
+            )
             for key, url in settings.DATABASE_DICT.items()
         },
         rabbit=rabbit.RabbitConfig(settings.RABBIT_URL),
+        limits=settings.RATE_LIMITS,
+        period=settings.RATE_PERIOD,
+        limiter_key=settings.RATE_LIMIT_KEY or None,
+        http_cache=settings.HTTP_CACHE or None,
+        coalesce=settings.HTTP_COALESCE,
+        http2=settings.HTTP2,
+        finality_depth=settings.BLOCK_FINALITY_DEPTH,
+        recent_ttl=settings.BLOCK_HEAD_MAX_AGE,
+        warmup=settings.CONTEXT_WARMUP,
+        timeouts=settings.RESOURCE_TIMEOUTS,
+        probe_interval=settings.HEALTH_PROBE_INTERVAL,
+        task_priorities=settings.TASK_PRIORITIES,
     )
     app.state.checker = RS256Checker(open('public.pem').read())
 
+    tracker = app.state.startup = StartupTracker()
+
     async with app.state.context:
+        required: list[asyncio.Task[None]] = []
         for startup_coro_func in startup_list:
+            is_required = startup_coro_func in required_startups
             task = asyncio.create_task(
-                startup_coro_func(app), name=startup_coro_func.__name__
+                tracker.run('required' if is_required else 'startup', startup_coro_func, app), name=startup_coro_func.__name__
             )
             task.add_done_callback(_startup_done)
+            if is_required:
+                required.append(task)
+        warmups: list[asyncio.Task[None]] = []
+        for warmup_coro_func in warmup_list:
+            task = asyncio.create_task(tracker.run('warmup', warmup_coro_func, app), name=warmup_coro_func.__name__)
+            task.add_done_callback(_startup_done)
+            warmups.append(task)
+        gate = asyncio.create_task(tracker.gate(required, warmups, settings.STARTUP_WARMUP_TIMEOUT))
 
         # Running
         yield
 
-        # Shutdown
+        # Shutdown: 取消就绪检查与仍在运行的预热任务, 等待它们结束
+        gate.cancel()
+        for task in warmups:
+            task.cancel()
+        await asyncio.gather(gate, *warmups, return_exceptions=True)
         tasks: list[asyncio.Task[None]] = []
         for end_coro_func in shutdown_list:
             tasks.append(
@@ -67,15 +157,34 @@ async def lifespan_context(app: FastAPI):
             )
             tasks[-1].add_done_callback(_shutdown_done)
         await asyncio.gather(*tasks)
+    # 写出队列中剩余的日志
+    stop_queue_logging()
 
 
 def on_startup(
+    func: LifespanCallable | None = None,
+    *,
+    required: bool = False
+):
+    """
+    配置初始化启动任务, required=True 时任务完成后服务才进入就绪状态(/ready)
+    用法: @on_startup 或 @on_startup(required=True)
+    """
+    def decorator(func: LifespanCallable):
+        startup_list.append(func)
+        if required:
+            required_startups.add(func)
+        return func
+    return decorator(func) if func is not None else decorator
+
+
+def on_warmup(
     func: LifespanCallable
 ):
     """
-    配置初始化启动任务
+    配置预热任务(例如预加载缓存), 所有预热任务并行执行, 超过 settings.STARTUP_WARMUP_TIMEOUT 秒未完成的会被取消
     """
-    startup_list.append(func)
+    warmup_list.append(func)
     return func
 
 
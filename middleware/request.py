@@ -1,16 +1,17 @@
 import asyncio
 from types import SimpleNamespace
 from typing import Any, Callable, Coroutine, Awaitable, Sequence
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
-from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from fastapi.requests import Request as BaseRequest
-from fastapi.responses import Response as BaseResponse
 from .security import SecurityData, RS256Checker, SecurityCheckerBase
-from data.logger import create_logger
+from data.logger import create_logger, json_format_enabled
 from colorama import Fore, Style
 from data import Context
 import json as jsonlib
 import datetime
+import logging
+import random
+import time
 
 
 class Request(BaseRequest):
@@ -101,12 +102,23 @@ class Request(BaseRequest):
         return cls(request.scope, request.receive)
 
 
-class RequestMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, public_key: str, url_filters: Sequence[str] = ['/ping']) -> None:
-        super().__init__(app)
+class RequestMiddleware:
+    """
+    纯 ASGI 中间件: 包装 send 获取响应状态与耗时, 记录访问日志, 并将 404 响应替换为 403
+
+    请求体在读取时顺带保留(最多 body_limit 字节), 仅用于 5xx 时打印排查信息
+    sample_rates 按状态码类别(2/3/4/5)设置访问日志采样率(未设置的类别全部记录), 耗时超过 slow_threshold 秒的请求总是记录
+    """
+    def __init__(self, app: ASGIApp, public_key: str, url_filters: Sequence[str] = ['/ping'], body_limit: int = 64 * 1024,
+                 sample_rates: dict[int, float] | None = None, slow_threshold: float | None = None) -> None:
+        self.app = app
+        self._sample_rates = sample_rates or {}
+        self._slow_threshold = slow_threshold
         self._checker = RS256Checker(public_key)
         self._access_logger = create_logger('access')
         self._path_filters = set(url_filters)
+        self._body_limit = body_limit
+        self._denied_body = jsonlib.dumps(dict(code=-1, message='Access Denied', data=None), ensure_ascii=False).encode()
 
 
     @classmethod
@@ -114,26 +126,84 @@ class RequestMiddleware(BaseHTTPMiddleware):
         return '\n'.join([f'{'-'.join(map(lambda s: s.capitalize(), k.split('-')))}: {v}' for k, v in headers.items()])
 
 
-    async def dispatch(self, request: BaseRequest, call_next: RequestResponseEndpoint) -> BaseResponse:
-        request = Request(request.scope, request.receive)
-        if not hasattr(request.app.state, 'checker'):
-            request.app.state.checker = self._checker
-        # request.authorize(request.app.state.checker)
-        response = await call_next(request)
-        if request.url.path not in self._path_filters:
-            base_text = f'{request.ip}#{request.region}-{request.method}<{response.status_code}>[{str(request.url.include_query_params())[:256]}]'
-            if response.status_code >= 500:
-                # 只有5xx的错误才有标记用户信息等数据排查问题的必要
-                try: user_data = jsonlib.dumps(request.user, ensure_ascii=False)
-                except: user_data = str(request.user)
-                self._access_logger.exception(base_text + f'\n{Fore.LIGHTWHITE_EX}UserData: {Fore.LIGHTBLUE_EX}' + user_data + f'\n{Fore.LIGHTWHITE_EX}RequestBody: {Fore.LIGHTBLUE_EX}' + (await request.body()).decode(errors='ignore') + Fore.LIGHTRED_EX)
-            elif response.status_code >= 400:
-                self._access_logger.warning(base_text)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        state = scope['app'].state
+        if not hasattr(state, 'checker'):
+            state.checker = self._checker
+
+        start = time.perf_counter()
+        status_code = 500
+        denied = False
+        logged = scope['path'] not in self._path_filters
+        chunks: list[bytes] = []
+        size = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal size
+            message = await receive()
+            if message['type'] == 'http.request' and size < self._body_limit:
+                body = message.get('body', b'')
+                if body:
+                    chunks.append(body)
+                    size += len(body)
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, denied
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if status_code == 404:
+                    denied = True
+                    await send({
+                        'type': 'http.response.start',
+                        'status': 403,
+                        'headers': [(b'content-length', str(len(self._denied_body)).encode())],
+                    })
+                    await send({'type': 'http.response.body', 'body': self._denied_body})
+                    return
+            elif denied:
+                # 丢弃原 404 响应的内容
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper if logged else receive, send_wrapper)
+        except Exception:
+            if logged:
+                self._log(scope, receive, 500, time.perf_counter() - start, b''.join(chunks), exc_info=True)
+            raise
+        if logged:
+            self._log(scope, receive, status_code, time.perf_counter() - start, b''.join(chunks))
+
+    def _log(self, scope: Scope, receive: Receive, status_code: int, elapsed: float, body: bytes, exc_info: bool = False):
+        level = logging.ERROR if status_code >= 500 else logging.WARNING if status_code >= 400 else logging.INFO
+        if not self._access_logger.isEnabledFor(level):
+            return
+        rate = self._sample_rates.get(status_code // 100, 1.0)
+        slow = self._slow_threshold is not None and elapsed >= self._slow_threshold
+        if not slow and rate < 1.0 and random.random() >= rate:
+            return
+        request = Request(scope, receive)
+        url = str(request.url.include_query_params())[:256]
+        fields = dict(
+            ip=request.ip, region=request.region, method=request.method, status=status_code, url=url,
+            elapsed_ms=round(elapsed * 1000, 1), sample_rate=1.0 if slow else rate, slow=slow,
+        )
+        base_text = f'{request.ip}#{request.region}-{request.method}<{status_code}>[{url}]{elapsed * 1000:.1f}ms'
+        if status_code >= 500:
+            # 只有5xx的错误才有标记用户信息等数据排查问题的必要
+            try: user_data = jsonlib.dumps(request.user, ensure_ascii=False)
+            except: user_data = str(request.user)
+            request_body = body[:self._body_limit].decode(errors='ignore')
+            if json_format_enabled():
+                fields.update(user=user_data, body=request_body)
+                self._access_logger.error(base_text, exc_info=exc_info, extra={'fields': fields})
             else:
-                self._access_logger.info(base_text)
-        if response.status_code == 404:
-            response = BaseResponse(content=jsonlib.dumps(
-                dict(code=-1, message='Access Denied', data=None),
-                ensure_ascii=False
-            ), status_code=403)
-        return response
+                self._access_logger.error(base_text + f'\n{Fore.LIGHTWHITE_EX}UserData: {Fore.LIGHTBLUE_EX}' + user_data + f'\n{Fore.LIGHTWHITE_EX}RequestBody: {Fore.LIGHTBLUE_EX}' + request_body + Fore.LIGHTRED_EX, exc_info=exc_info, extra={'fields': fields})
+        elif slow or status_code >= 400:
+            self._access_logger.warning(base_text, extra={'fields': fields})
+        else:
+            self._access_logger.info(base_text, extra={'fields': fields})
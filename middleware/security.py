@@ -1,11 +1,12 @@
 import base64
+from collections import OrderedDict
 from enum import Enum
 from typing import Callable, Any, Mapping
 from pydantic import BaseModel
 import hmac
 import hashlib
 import time
-from jose import jwt, exceptions as jwt_exc
+from jose import jwk, jwt, exceptions as jwt_exc
 import json
 
 
@@ -110,24 +111,55 @@ class SecurityCheckerBase:
 
 
 class RS256Checker(SecurityCheckerBase):
-    def __init__(self, public_key: str | dict[str, Any]) -> None:
-        self._public_key = public_key
-
-    def checker_bearer(self, token: str, headers: dict[str, str]) -> SecurityData:
+    """
+    RS256 Bearer Token 验证
+
+    公钥在创建时解析一次; 验证结果按 Token 的 sha256 缓存(LRU, 最多 cache_size 个):
+    验证通过的结果缓存到 exp(没有 exp 时最多 max_ttl 秒), 验证失败的结果缓存 negative_ttl 秒
+    缓存的 SecurityData 会被多个请求共享, 不要修改其中的 data
+    """
+    def __init__(self, public_key: str | dict[str, Any], cache_size: int = 4096, negative_ttl: float = 5.0, max_ttl: float = 300.0) -> None:
+        self._public_key = jwk.construct(public_key, 'RS256')
+        self._cache: OrderedDict[bytes, tuple[float, SecurityData]] = OrderedDict()
+        self._cache_size = cache_size
+        self._negative_ttl = negative_ttl
+        self._max_ttl = max_ttl
+
+    def _verify(self, token: str) -> tuple[SecurityData, float]:
         failed_result = SecurityData(
             auth=token,
             verified=False,
             certificated=SecurityStatus.AUTH_FAILED,
         )
+        now = time.time()
         try:
             data = jwt.decode(token, self._public_key, algorithms=['RS256'], options={"verify_aud": False})
+            expires = now + self._max_ttl
+            if isinstance(data.get('exp'), (int, float)):
+                expires = min(expires, float(data['exp']))
             return SecurityData(
                 auth=token,
                 verified=True,
                 certificated=SecurityStatus.AUTHORIZED,
                 data=data,
-            )
+            ), expires
         except jwt_exc.ExpiredSignatureError:
-            return failed_result.with_certificated(SecurityStatus.AUTH_EXPIRED)
+            return failed_result.with_certificated(SecurityStatus.AUTH_EXPIRED), now + self._negative_ttl
         except jwt_exc.JWTError:
-            return failed_result
+            return failed_result, now + self._negative_ttl
+
+    def checker_bearer(self, token: str, headers: dict[str, str]) -> SecurityData:
+        if self._cache_size <= 0:
+            return self._verify(token)[0]
+        key = hashlib.sha256(token.encode()).digest()
+        item = self._cache.get(key)
+        if item is not None:
+            if item[0] > time.time():
+                self._cache.move_to_end(key)
+                return item[1]
+            del self._cache[key]
+        result, expires = self._verify(token)
+        self._cache[key] = (expires, result)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return result
@@ -1,15 +1,19 @@
 from data import Context, rabbit, cache, db
+from data.fetch import TokenBucket
+from data.metrics import MetricsRegistry
 from pydantic import BaseModel
 from typing import Any, Callable, Awaitable
-from data.logger import create_logger
+from data.logger import create_logger, start_queue_logging, stop_queue_logging, use_json_format
 from sqlalchemy.exc import DatabaseError
 from sqlalchemy.ext.asyncio import AsyncEngine
 from middleware.lifespan import startup_list, shutdown_list
+import contextlib
 import traceback
 import logging
 import asyncio
 import settings
 import random
+import time
 import xxhash
 
 
@@ -47,10 +51,18 @@ class ErrorLogModel(BaseModel):
         )
 
 
+class TaskOption(BaseModel):
+    rate: int | None = None  # 每 period 秒最多执行次数
+    period: float = 1.0
+    concurrency: int | None = None  # 最大同时执行数量
+
+
 TaskHandler = Callable[[Context, TaskEntry], Awaitable[None]] | Callable[[Context, TaskEntry], None]
 
 
 NOW_RUNTIME_SEED = random.randint(0, 2**32 - 1)
+# 等待限频的消息已占满余量时, 新的限频任务消息等待该时间(秒)后放回队列
+THROTTLED_REQUEUE_DELAY = 1.0
 
 
 class AppContext:
@@ -59,8 +71,23 @@ class AppContext:
         self.queues = name.split(';')
         self.logger = create_logger(f'Worker-{name}', logging.ERROR, True, False)
         self.callables: dict[str, TaskHandler] = {}
+        self.options: dict[str, TaskOption] = {}
+        self.limiters: dict[str, TokenBucket] = {}
+        self.semaphores: dict[str, asyncio.Semaphore] = {}
+        self.prefetch = max(settings.TASK_PREFETCH, 1)
         self.loops: dict[str, Callable[['AppContext', Context], Awaitable[None]]] = {}
         self.loop_tasks: dict[str, asyncio.Task[None]] = {}
+        self.metrics = MetricsRegistry('worker_')
+        self.metrics_server: asyncio.Server | None = None
+        self.task_latency = self.metrics.histogram('task_duration_seconds', 'Task handler latency', ('task',))
+        self.task_results = self.metrics.counter('tasks_total', 'Handled task messages by result', ('queue', 'task', 'result'))
+        self.task_retries = self.metrics.counter('task_retries_total', 'Redelivered task messages', ('queue', 'task'))
+        self.queue_lag = self.metrics.histogram('queue_lag_seconds', 'Time between publish and consume', ('queue',))
+        self.queue_depth = self.metrics.gauge('queue_depth', 'Messages ready in the broker queue', ('queue',))
+        self.inflight = self.metrics.gauge('inflight_messages', 'Unacknowledged messages being handled', ('queue',))
+        self.prefetch_limit = self.metrics.gauge('prefetch_limit', 'Consumer prefetch count', ('queue',))
+        self.loop_alive = self.metrics.gauge('loop_alive', 'Whether the loop task is still running', ('loop',))
+        self.metrics.collector(self._collect_liveness)
 
     def loop(self, loop_name: str):
         """
@@ -73,23 +100,53 @@ class AppContext:
             return func
         return wrapper
 
-    def register(self, task: str):
+    def register(self, task: str, *, rate: int | None = None, period: float = 1.0, concurrency: int | None = None):
         """
-        注册任务处理函数
+        注册任务处理函数(消息优先级由发送方决定, 见 settings.TASK_PRIORITIES 与 Context.send_task)
+
+        :param rate: 每 period 秒最多执行 rate 次(令牌桶限频)
+        :param concurrency: 该任务同时执行的最大数量
         """
+        option = TaskOption(rate=rate, period=period, concurrency=concurrency)
         def wrapper(func: TaskHandler):
             self.callables[task] = func
+            self.options[task] = option
+            if option.rate:
+                self.limiters[task] = TokenBucket(option.rate, option.period)
+            if option.concurrency:
+                self.semaphores[task] = asyncio.Semaphore(option.concurrency)
             return func
         return wrapper
 
     async def __aenter__(self):
+        if settings.LOG_FORMAT == 'json':
+            use_json_format({'service': f'worker:{";".join(self.queues)}', 'env': settings.ENV})
+        if settings.LOG_QUEUE_SIZE > 0:
+            start_queue_logging(settings.LOG_QUEUE_SIZE, settings.LOG_QUEUE_POLICY)
         self.context = Context(
             cache=cache.RedisConfig(settings.CACHE_URL),
             databases={
-                key: db.DatabaseConfig(url)
+                key: db.DatabaseConfig(
+                    url,
+                    replicas=settings.DATABASE_REPLICAS.get(key),
+                    read_routing=settings.DATABASE_READ_ROUTING,
+                    sticky_window=settings.DATABASE_STICKY_WINDOW,
+                )
                 for key, url in settings.DATABASE_DICT.items()
             },
             rabbit=rabbit.RabbitConfig(settings.RABBIT_URL),
+            limits=settings.RATE_LIMITS,
+            period=settings.RATE_PERIOD,
+            limiter_key=settings.RATE_LIMIT_KEY or None,
+            http_cache=settings.HTTP_CACHE or None,
+            coalesce=settings.HTTP_COALESCE,
+            http2=settings.HTTP2,
+            finality_depth=settings.BLOCK_FINALITY_DEPTH,
+            recent_ttl=settings.BLOCK_HEAD_MAX_AGE,
+            warmup=settings.CONTEXT_WARMUP,
+            timeouts=settings.RESOURCE_TIMEOUTS,
+            probe_interval=settings.HEALTH_PROBE_INTERVAL,
+            task_priorities=settings.TASK_PRIORITIES,
         )
         await self.context.initalize()
         return self
@@ -103,54 +160,152 @@ class AppContext:
         except Exception as e:
             self.logger.exception(f"Task {task.get_name()} failed: {e}")
 
-    async def invoke(self, task: TaskEntry):
-        assert self.context is not None, "Context is not initialized"
-        if task.task in self.callables:
-            # return asyncio.create_task(self.callables[task.task](self.context, task))
-            if asyncio.iscoroutinefunction(self.callables[task.task]):
-                await self.callables[task.task](self.context, task)
-            else:
-                self.callables[task.task](self.context, task)
+    def throttled(self, task: TaskEntry) -> bool:
+        """
+        任务是否有限频或并发限制
+        """
+        return task.task in self.limiters or task.task in self.semaphores
 
-    async def run_receiver(self, queue: str):
-        async for task, message in self.context.amqp.receive(queue, TaskEntry):
+    async def invoke(self, task: TaskEntry, slots: asyncio.Semaphore | None = None, waiting: asyncio.Semaphore | None = None):
+        """
+        执行任务: 先等待该任务的并发名额与限频令牌(占用 waiting), 拿到后才占用执行槽位 slots
+        """
+        assert self.context is not None, "Context is not initialized"
+        if task.task not in self.callables:
+            return
+        semaphore = self.semaphores.get(task.task)
+        async with waiting or contextlib.nullcontext():
+            if semaphore is not None:
+                await semaphore.acquire()
             try:
-                await self.invoke(task)
-                await message.ack()
-            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                if task.task in self.limiters:
+                    await self.limiters[task.task].acquire()
+            except BaseException:
+                if semaphore is not None:
+                    semaphore.release()
                 raise
-            except DatabaseError:
-                self.logger.exception(f"Database error, restart all database session")
-                await message.nack(requeue=True)
-                await self.context.database.restart()
-            except Exception as e:
-                self.logger.exception(f"[{queue}]Task {task.task}({task.identity}) failed: {e}")
-                await self.context.amqp.send('error-log', ErrorLogModel(
-                    title='Worker事件处理出错',
-                    content=[
-                        [
-                            {
-                                "tag": "text",
-                                "text": f"任务{task.task}({task.identity})执行失败: {e}\n"
-                            },
-                        ],
-                        [
-                            {
-                                "tag": "text",
-                                "text": self.context.traceback
-                            }
-                        ],
-                        [
-                            {
-                                "tag": "text",
-                                "text": f"\n{queue}-Worker监控将被阻塞，请尽快处理"
-                            }
-                        ]
+        try:
+            async with slots or contextlib.nullcontext():
+                start = time.perf_counter()
+                try:
+                    # return asyncio.create_task(self.callables[task.task](self.context, task))
+                    if asyncio.iscoroutinefunction(self.callables[task.task]):
+                        await self.callables[task.task](self.context, task)
+                    else:
+                        self.callables[task.task](self.context, task)
+                finally:
+                    self.task_latency.observe(time.perf_counter() - start, task=task.task)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def run_receiver(self, queue: str):
+        # 最多同时执行 prefetch 个任务; 等待限频/并发名额的消息不占用执行槽位, 最多 prefetch 条,
+        # 因此向 RabbitMQ 预取 2 * prefetch 条消息, 被限频的任务不会挤占其他任务
+        slots = asyncio.Semaphore(self.prefetch)
+        waiting = asyncio.Semaphore(self.prefetch)
+        pending: set[asyncio.Task[None]] = set()
+        self.prefetch_limit.set(self.prefetch * 2, queue=queue)
+        self.inflight.set(0, queue=queue)
+        try:
+            async for task, message in self.context.amqp.receive(
+                queue, TaskEntry, prefetch=self.prefetch * 2, max_priority=settings.TASK_MAX_PRIORITY
+            ):
+                handler = asyncio.create_task(self.handle(queue, task, message, slots, waiting))
+                handler.set_name(f"Worker-{queue}-Task.{task.task}")
+                pending.add(handler)
+                handler.add_done_callback(pending.discard)
+        finally:
+            for handler in pending:
+                handler.cancel()
+
+    async def handle(self, queue: str, task: TaskEntry, message: rabbit.IncomingMessage,
+                     slots: asyncio.Semaphore | None = None, waiting: asyncio.Semaphore | None = None):
+        """
+        处理单条任务消息
+        """
+        throttled = self.throttled(task)
+        if throttled and waiting is not None and waiting.locked():
+            # 等待限频的消息已占满余量, 放回队列, 把预取名额留给其他任务
+            await asyncio.sleep(THROTTLED_REQUEUE_DELAY)
+            await message.nack(requeue=True)
+            self.task_results.inc(queue=queue, task=task.task, result='requeued')
+            return
+        if message.redelivered:
+            self.task_retries.inc(queue=queue, task=task.task)
+        if message.timestamp is not None:
+            self.queue_lag.observe(max(time.time() - message.timestamp.timestamp(), 0), queue=queue)
+        self.inflight.inc(queue=queue)
+        try:
+            await self.invoke(task, slots, waiting if throttled else None)
+            await message.ack()
+            self.task_results.inc(queue=queue, task=task.task, result='success')
+        except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+            raise
+        except DatabaseError:
+            self.task_results.inc(queue=queue, task=task.task, result='failure')
+            self.logger.exception(f"Database error in task {task.task}({task.identity})")
+            await message.nack(requeue=True)
+            # 只重建出现断连的数据库连接池(带退避), 不影响其他数据库与进行中的会话
+            rebuilt = await self.context.database.recover()
+            if rebuilt:
+                self.logger.warning(f"Rebuilt database pools: {', '.join(rebuilt)}")
+        except Exception as e:
+            self.task_results.inc(queue=queue, task=task.task, result='failure')
+            self.logger.exception(f"[{queue}]Task {task.task}({task.identity}) failed: {e}")
+            await self.context.amqp.send('error-log', ErrorLogModel(
+                title='Worker事件处理出错',
+                content=[
+                    [
+                        {
+                            "tag": "text",
+                            "text": f"任务{task.task}({task.identity})执行失败: {e}\n"
+                        },
+                    ],
+                    [
+                        {
+                            "tag": "text",
+                            "text": self.context.traceback
+                        }
                     ],
-                    identity=xxhash.xxh3_128_hexdigest(f"{queue}-{task.task}-{task.identity}-{e}", NOW_RUNTIME_SEED)
-                ))
-                await message.nack(requeue=True)
-                await asyncio.sleep(15)
+                    [
+                        {
+                            "tag": "text",
+                            "text": f"\n{queue}-Worker监控将被阻塞，请尽快处理"
+                        }
+                    ]
+                ],
+                identity=xxhash.xxh3_128_hexdigest(f"{queue}-{task.task}-{task.identity}-{e}", NOW_RUNTIME_SEED)
+            ))
+            await message.nack(requeue=True)
+            await asyncio.sleep(15)
+        finally:
+            self.inflight.dec(queue=queue)
+
+    def _collect_liveness(self):
+        for name, task in self.loop_tasks.items():
+            self.loop_alive.set(0 if task.done() else 1, loop=name)
+
+    async def run_metrics(self):
+        """
+        启动指标服务并定时拉取队列深度
+        """
+        try:
+            self.metrics_server = await self.metrics.serve(settings.METRICS_HOST, settings.METRICS_PORT)
+        except OSError as e:
+            self.logger.error(f"Metrics server failed to listen on {settings.METRICS_HOST}:{settings.METRICS_PORT}: {e}")
+        while True:
+            for queue in self.queues:
+                if '/' in queue:
+                    # 绑定交换器的临时队列没有固定名称
+                    continue
+                try:
+                    self.queue_depth.set(await self.context.amqp.queue_depth(queue), queue=queue)
+                except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                    raise
+                except Exception as e:
+                    self.logger.error(f"Polling depth of queue {queue} failed: {e}")
+            await asyncio.sleep(settings.METRICS_POLL_INTERVAL)
 
     async def run(self):
         """
@@ -169,6 +324,13 @@ class AppContext:
             task.add_done_callback(self._task_done)
             task.set_name(f"Worker-{queue}")
             self.loop_tasks[f'{queue}.worker'] = task
+        if settings.METRICS_PORT:
+            if settings.DATABASE_DICT:
+                self.context.database.export(self.metrics)
+            task = asyncio.create_task(self.run_metrics())
+            task.add_done_callback(self._task_done)
+            task.set_name(f"Worker-{self.queues}-Metrics")
+            self.loop_tasks['metrics.worker'] = task
         await asyncio.gather(*self.loop_tasks.values())
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -178,6 +340,10 @@ class AppContext:
         for task in self.loop_tasks.values():
             try: task.cancel()
             except: pass
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
         await self.context.close()
         self.context = None
+        stop_queue_logging()
         return False
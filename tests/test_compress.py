@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from middleware.compress import CompressionMiddleware, PrecompressedAsset
+
+BODY = {'items': list(range(1000))}
+
+
+async def block(request: Request) -> Response:
+    if request.headers.get('if-none-match'):
+        return Response(status_code=304, headers={'ETag': '"abc"'})
+    return JSONResponse(BODY, headers={'ETag': '"abc"'})
+
+
+asset = PrecompressedAsset(lambda: b'x' * 4096, 'text/plain', encodings=['gzip'])
+
+
+async def static(request: Request) -> Response:
+    return await asset.response(request)
+
+
+app = CompressionMiddleware(Starlette(routes=[Route('/block', block), Route('/static', static)]), encodings=['gzip'])
+
+
+def test_compressed_responses_do_not_share_strong_etag():
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            response = await client.get('/block', headers={'Accept-Encoding': 'gzip'})
+            assert response.headers['content-encoding'] == 'gzip' and response.json() == BODY
+            assert response.headers['etag'] == 'W/"abc"'
+            response = await client.get('/block', headers={'Accept-Encoding': 'identity'})
+            assert 'content-encoding' not in response.headers and response.headers['etag'] == '"abc"'
+            response = await client.get('/block', headers={'Accept-Encoding': 'gzip', 'If-None-Match': 'W/"abc"'})
+            assert response.status_code == 304 and response.headers['etag'] == 'W/"abc"'
+
+            gzip = await client.get('/static', headers={'Accept-Encoding': 'gzip'})
+            identity = await client.get('/static', headers={'Accept-Encoding': 'identity'})
+            assert gzip.headers['content-encoding'] == 'gzip' and gzip.content == identity.content
+            assert gzip.headers['etag'] != identity.headers['etag']
+            response = await client.get('/static', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip.headers['etag']})
+            assert response.status_code == 304
+            response = await client.get('/static', headers={'Accept-Encoding': 'identity', 'If-None-Match': gzip.headers['etag']})
+            assert response.status_code == 200
+
+    asyncio.run(main())
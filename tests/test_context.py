@@ -0,0 +1,14 @@
+import asyncio
+
+from data import Context
+from data.cache import RedisConfig
+from data.fetch import RedisLimiter
+
+
+def test_shared_limiter_keeps_cache_lazy():
+    async def main():
+        async with Context(cache=RedisConfig('redis://127.0.0.1:6379/0'), limiter_key='rate-limit:test') as context:
+            assert isinstance(context.client.limiter, RedisLimiter)
+            assert context._cache is None
+
+    asyncio.run(main())
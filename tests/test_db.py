@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+from data.db import InvalidCursor, Pagination, bulk_upsert, declare_database
+from web3_db import Block
+
+
+def block(number: int, hash: str | None = None) -> dict:
+    return {'number': number, 'hash': hash or f'h{number}', 'timestamp': number, 'transactions': ''}
+
+
+def test_bulk_upsert_sqlite(tmp_path):
+    async def main():
+        db = declare_database(url=f'sqlite+aiosqlite:///{tmp_path / "upsert.db"}')
+        async with db() as session:
+            await session.execute(sa.schema.CreateTable(Block.__table__))
+            # 每批 8 个参数 = 2 行, 10 行分为 5 批
+            result = await bulk_upsert(session, Block, [block(n) for n in range(10)], max_params=8)
+            assert (result.inserted, result.skipped, result.exact) == (10, 0, True)
+            # 区块号重复与哈希重复都被跳过, 跨批次统计
+            rows = [block(n) for n in range(8, 13)] + [block(100, 'h0')]
+            result = await bulk_upsert(session, Block, rows, max_params=8)
+            assert (result.inserted, result.skipped) == (3, 3)
+            # 更新模式
+            result = await bulk_upsert(session, Block, [block(1, 'new')], update=['hash'])
+            assert result.inserted == 1
+            await session.commit()
+            assert (await session.execute(sa.select(sa.func.count()).select_from(Block))).scalar() == 13
+            assert (await session.execute(sa.select(Block.hash).where(Block.number == 1))).scalar() == 'new'
+        await db.kw['bind'].dispose()
+
+    asyncio.run(main())
+
+
+table = sa.table('block', sa.column('number'))
+pagination = Pagination(table.c.number, limit=100, max_limit=1000, descending=True)
+
+
+def test_pagination_clamps_limit():
+    for limit, expected in ((-2, 2), (0, 101), (5000, 1001), (10, 11)):
+        statement = pagination.apply(sa.select(table), None, limit)
+        assert statement._limit == expected
+    rows = [{'number': n} for n in range(10, 0, -1)]
+    page = pagination.page(rows, -2)
+    assert [row['number'] for row in page['items']] == [10]
+    assert page['next'] is not None
+
+
+def test_pagination_rejects_invalid_cursor():
+    cursor = pagination.encode_cursor([5])
+    assert pagination.decode_cursor(cursor) == [5]
+    with pytest.raises(InvalidCursor):
+        pagination.apply(sa.select(table), 'not-a-cursor')
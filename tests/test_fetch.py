@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from data.fetch import AsyncLimitClient, CircuitOpen, RetryPolicy
+from data.httpcache import ResponseCache, MemoryCacheStorage, jsonrpc_rule, parse_jsonrpc
+
+
+def block_request(client: AsyncLimitClient, number: str) -> httpx.Request:
+    body = {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_getBlockByNumber', 'params': [number, False]}
+    return client.build_request('POST', 'http://rpc.test/', json=body)
+
+
+def test_use_cache_keeps_coalescing_state():
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={'jsonrpc': '2.0', 'id': json.loads(request.content)['id'], 'result': {'number': '0x1'}})
+
+    async def main():
+        client = AsyncLimitClient(limits=10, coalesce=True, transport=httpx.MockTransport(handler))
+        client.use_cache(ResponseCache(MemoryCacheStorage(), rules=[jsonrpc_rule()]))
+        responses = await asyncio.gather(*(client.send(block_request(client, '0x1')) for _ in range(5)))
+        assert all(response.json()['result'] == {'number': '0x1'} for response in responses)
+        assert calls == 1
+        assert client.coalesce_leaders == 1 and client.coalesced == 4
+        # 第二次请求命中缓存
+        await client.send(block_request(client, '0x1'))
+        assert calls == 1
+        await client.aclose()
+
+    asyncio.run(main())
+
+
+def test_jsonrpc_rule_short_ttl_near_head():
+    rule = jsonrpc_rule(ttl=86400, finality_depth=64, recent_ttl=6)
+    cache = ResponseCache(MemoryCacheStorage(), rules=[rule])
+    client = AsyncLimitClient()
+
+    def ttl(number: int) -> float | None:
+        request = block_request(client, hex(number))
+        return rule(request, parse_jsonrpc(request))
+
+    # 最新区块未知时按可能被重组处理
+    assert ttl(100) == 6
+
+    async def observe_head():
+        body = {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_blockNumber', 'params': []}
+        request = client.build_request('POST', 'http://rpc.test/', json=body)
+        response = httpx.Response(200, json={'jsonrpc': '2.0', 'id': 1, 'result': hex(1000)}, request=request)
+        assert not await cache.store(request, response)
+        await client.aclose()
+
+    asyncio.run(observe_head())
+    assert rule.head == 1000
+    assert ttl(1000 - 64) == 86400
+    assert ttl(1000 - 63) == 6
+
+
+class BrokenStorage:
+    async def get(self, key: str) -> bytes | None:
+        raise ConnectionError('cache down')
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise ConnectionError('cache down')
+
+
+def test_cache_storage_errors_do_not_fail_requests():
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(200, json={'jsonrpc': '2.0', 'id': 1, 'result': {'number': '0x1'}})
+
+    async def main():
+        client = AsyncLimitClient(cache=ResponseCache(BrokenStorage(), rules=[jsonrpc_rule()]),
+                                  transport=httpx.MockTransport(handler))
+        for _ in range(2):
+            response = await client.send(block_request(client, '0x1'))
+            assert response.json()['result'] == {'number': '0x1'}
+        assert calls == 2
+        await client.aclose()
+
+    asyncio.run(main())
+
+
+def test_rate_limited_responses_do_not_open_circuit():
+    calls, throttled = 0, False
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if throttled or calls % 2:
+            return httpx.Response(429, headers={'Retry-After': '0'})
+        return httpx.Response(200, json={'jsonrpc': '2.0', 'id': 1, 'result': {'number': '0x1'}})
+
+    async def main():
+        nonlocal throttled
+        client = AsyncLimitClient(limits=100, failure_threshold=2, transport=httpx.MockTransport(handler))
+        for _ in range(3):
+            response = await client.send(block_request(client, '0x1'))
+            assert response.status_code == 200
+        assert calls == 6
+        # 重试用尽仍是 429 时返回 429, 之后的请求不会被熔断
+        throttled = True
+        for _ in range(3):
+            assert (await client.send(block_request(client, '0x1'))).status_code == 429
+        assert client.breaker('rpc.test').state == 'closed'
+        await client.aclose()
+
+    asyncio.run(main())
+
+
+def test_circuit_counts_one_failure_per_request():
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(503)
+
+    async def main():
+        client = AsyncLimitClient(limits=100, failure_threshold=2, retry=RetryPolicy(retries=3, backoff=0),
+                                  transport=httpx.MockTransport(handler))
+        assert (await client.send(block_request(client, '0x1'))).status_code == 503
+        assert calls == 3 and client.breaker('rpc.test').state == 'closed'
+        await client.send(block_request(client, '0x1'))
+        with pytest.raises(CircuitOpen):
+            await client.send(block_request(client, '0x1'))
+        await client.aclose()
+
+    asyncio.run(main())
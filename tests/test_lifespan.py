@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi import FastAPI
+
+from middleware import lifespan
+
+
+def test_startup_hooks_with_same_name_and_warmup_cancel(monkeypatch):
+    def make(result: list):
+        async def hook(app):
+            result.append(True)
+        return hook
+
+    first, second = make([]), make([])
+    first.__module__, second.__module__ = 'apps.a.views', 'apps.b.views'
+    cancelled = asyncio.Event()
+
+    async def slow_warmup(app):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(lifespan, 'startup_list', [first, second])
+    monkeypatch.setattr(lifespan, 'warmup_list', [slow_warmup])
+    monkeypatch.setattr(lifespan, 'shutdown_list', [])
+    monkeypatch.setattr(lifespan.settings, 'STARTUP_WARMUP_TIMEOUT', 60)
+    monkeypatch.setattr(lifespan, 'RS256Checker', lambda key: None)
+
+    async def main():
+        app = FastAPI()
+        async with lifespan.lifespan_context(app):
+            await asyncio.sleep(0.01)
+            hooks = app.state.startup.report()['hooks']
+            assert {'apps.a.views.test_startup_hooks_with_same_name_and_warmup_cancel.<locals>.make.<locals>.hook',
+                    'apps.b.views.test_startup_hooks_with_same_name_and_warmup_cancel.<locals>.make.<locals>.hook'} < set(hooks)
+        assert cancelled.is_set()
+
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+import logging
+import queue
+import threading
+import time
+
+from data.logger import QueueHandler, QueueListener
+
+
+class SlowHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        time.sleep(0.01)
+        self.records.append(record)
+
+
+def record(level: int) -> logging.LogRecord:
+    return logging.LogRecord('test', level, __file__, 1, 'message', None, None)
+
+
+def test_drop_policy_never_blocks():
+    handler = QueueHandler(queue.Queue(1), SlowHandler(), 'drop')
+    begin = time.perf_counter()
+    for level in (logging.INFO, logging.INFO, logging.ERROR):
+        handler.handle(record(level))
+    assert time.perf_counter() - begin < 1
+    assert handler.dropped == 2 and handler.dropped_warnings == 1
+
+
+def test_listener_stops_with_full_queue():
+    log_queue, target, release = queue.Queue(2), SlowHandler(), threading.Event()
+    blocked = SlowHandler()
+    blocked.emit = lambda record: release.wait()
+    listener = QueueListener(log_queue)
+    listener.start()
+    log_queue.put((blocked, record(logging.INFO)))
+    while not log_queue.empty():
+        time.sleep(0.001)
+    # 后台线程卡在第一条日志上, 队列被填满
+    for _ in range(2):
+        log_queue.put_nowait((target, record(logging.INFO)))
+    threading.Timer(0.05, release.set).start()
+    listener.stop()
+    assert len(target.records) == 2
@@ -0,0 +1,10 @@
+import pytest
+
+from views.render import dumps
+
+
+def test_dumps_rejects_non_finite_floats():
+    assert dumps({'a': None, 'b': 1.5}) == b'{"a":null,"b":1.5}'
+    for value in (float('nan'), float('inf'), [{'x': float('-inf')}]):
+        with pytest.raises(ValueError):
+            dumps({'value': value})
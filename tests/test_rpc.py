@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from data.fetch import AsyncLimitClient, RetryPolicy
+from data.rpc import RpcError, RpcPool
+
+
+def test_use_client_closes_own_client():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={'jsonrpc': '2.0', 'id': 1, 'result': '0x1'})
+
+    async def main():
+        pool = RpcPool(['http://a.test/'], hedge=False)
+        own = pool.client
+        shared = AsyncLimitClient(transport=httpx.MockTransport(handler))
+        await pool.use_client(shared)
+        assert own.is_closed and pool.client is shared
+        assert (await pool.request('eth_blockNumber', []))['result'] == '0x1'
+        # 共享的客户端由其所有者关闭
+        other = AsyncLimitClient()
+        await pool.use_client(other)
+        assert not shared.is_closed
+        await pool.close()
+        assert not other.is_closed
+        await shared.aclose()
+        await other.aclose()
+
+    asyncio.run(main())
+
+
+def test_all_endpoints_down_raises_connection_error():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError('connection refused', request=request)
+
+    async def main():
+        client = AsyncLimitClient(retry=RetryPolicy(retries=1), transport=httpx.MockTransport(handler))
+        pool = RpcPool(['http://a.test/', 'http://b.test/'], client=client, hedge=False)
+        with pytest.raises(ConnectionError) as info:
+            await pool.request('web3_clientVersion', [])
+        assert isinstance(info.value, RpcError) and len(info.value.errors) == 2
+        await client.aclose()
+
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import asyncio
+
+from tasks import AppContext, TaskEntry
+
+
+class Message:
+    redelivered = False
+    timestamp = None
+
+    def __init__(self) -> None:
+        self.acked = self.requeued = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue: bool = False):
+        self.requeued = requeue
+
+
+def test_throttled_tasks_do_not_hold_execution_slots(monkeypatch):
+    monkeypatch.setattr('tasks.THROTTLED_REQUEUE_DELAY', 0)
+    app = AppContext('test')
+    app.context = object()
+    done = []
+
+    @app.register('slow', rate=1, period=60)
+    async def slow(context, task):
+        done.append(task.identity)
+
+    @app.register('cheap')
+    async def cheap(context, task):
+        done.append(task.identity)
+
+    async def main():
+        slots, waiting = asyncio.Semaphore(1), asyncio.Semaphore(1)
+        entry = lambda name, identity: TaskEntry(task=name, identity=identity, data={})
+        messages = [Message() for _ in range(4)]
+        first = asyncio.create_task(app.handle('q', entry('slow', 's1'), messages[0], slots, waiting))
+        second = asyncio.create_task(app.handle('q', entry('slow', 's2'), messages[1], slots, waiting))
+        await asyncio.sleep(0.01)
+        # s2 等待令牌, 占满了等待余量; 第三条限频消息被放回队列, 普通任务照常执行
+        await app.handle('q', entry('slow', 's3'), messages[2], slots, waiting)
+        await app.handle('q', entry('cheap', 'c1'), messages[3], slots, waiting)
+        await first
+        assert done == ['s1', 'c1']
+        assert messages[2].requeued and not messages[2].acked
+        assert messages[3].acked and not second.done()
+        second.cancel()
+
+    asyncio.run(main())
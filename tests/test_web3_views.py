@@ -0,0 +1,57 @@
+import asyncio
+from types import SimpleNamespace
+
+import apps.web3.views as views
+
+
+class HexValue(str):
+    def hex(self) -> str:
+        return str(self)
+
+
+def chain_block(number: int, block_hash: str) -> SimpleNamespace:
+    return SimpleNamespace(number=number, hash=HexValue(block_hash), timestamp=number, transactions=[HexValue('t1')])
+
+
+def test_chain_head_caches_failures(monkeypatch):
+    calls = 0
+
+    class Eth:
+        @property
+        async def block_number(self):
+            nonlocal calls
+            calls += 1
+            raise ConnectionError('node down')
+
+    monkeypatch.setattr(views, 'w3', SimpleNamespace(eth=Eth()))
+
+    async def main():
+        head = views.ChainHead(ttl=60)
+        assert await asyncio.gather(*(head.get() for _ in range(5))) == [None] * 5
+        assert calls == 1
+
+    asyncio.run(main())
+
+
+def test_verify_finalized_replaces_reorged_block(monkeypatch):
+    replaced = []
+
+    async def get_block(number):
+        return chain_block(number, 'canonical')
+
+    async def replace_block(block):
+        replaced.append(block)
+
+    monkeypatch.setattr(views, 'w3', SimpleNamespace(eth=SimpleNamespace(get_block=get_block)))
+    monkeypatch.setattr(views, 'replace_block', replace_block)
+    monkeypatch.setattr(views, 'verified_blocks', views.OrderedDict())
+
+    async def main():
+        corrected = await views.verify_finalized(SimpleNamespace(number=10, hash='orphaned'))
+        assert corrected['hash'] == 'canonical' and replaced == [corrected]
+        # 核对过的区块不再请求节点
+        assert await views.verify_finalized(SimpleNamespace(number=10, hash='canonical')) is None
+        assert len(replaced) == 1
+        assert await views.verify_finalized(SimpleNamespace(number=11, hash='canonical')) is None
+
+    asyncio.run(main())
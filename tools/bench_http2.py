@@ -0,0 +1,121 @@
+"""
+HTTP/1.1 与 HTTP/2 吞吐/延迟对比: 本地起一个模拟 RPC 节点(每个请求固定延迟), 分别用两种模式的 AsyncLimitClient 压测
+运行方式(项目根目录): python -m tools.bench_http2
+"""
+import asyncio
+import json
+import statistics
+import time
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.settings
+
+from data.fetch import AsyncLimitClient
+
+HOST = '127.0.0.1'
+H1_PORT = 18545
+H2_PORT = 18546
+LATENCY = 0.05  # 模拟节点处理耗时
+REQUESTS = 2048
+CALLERS = 64  # 并发调用者数量, 每个调用者依次发送 REQUESTS / CALLERS 个请求
+BODY = json.dumps({'jsonrpc': '2.0', 'id': 1, 'result': '0x1'}).encode()
+
+
+# HTTP/1.1 模拟节点(keep-alive, 每个连接同一时间只处理一个请求)
+async def handle_h1(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            if length:
+                await reader.readexactly(length)
+            await asyncio.sleep(LATENCY)
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                + f'Content-Length: {len(BODY)}\r\n\r\n'.encode() + BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+# HTTP/2 模拟节点(明文 h2c, 同一连接上的流并发处理)
+class H2Protocol(asyncio.Protocol):
+    def __init__(self) -> None:
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        self.transport: asyncio.Transport | None = None
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.conn.update_settings({h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 1000})
+        transport.write(self.conn.data_to_send())
+
+    def data_received(self, data: bytes):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.DataReceived):
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                asyncio.create_task(self.respond(event.stream_id))
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id: int):
+        await asyncio.sleep(LATENCY)
+        self.conn.send_headers(stream_id, [
+            (':status', '200'), ('content-type', 'application/json'), ('content-length', str(len(BODY))),
+        ])
+        self.conn.send_data(stream_id, BODY, end_stream=True)
+        self.transport.write(self.conn.data_to_send())
+
+
+async def bench(name: str, client: AsyncLimitClient, url: str):
+    latencies: list[float] = []
+    payload = {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_blockNumber', 'params': []}
+
+    async def one():
+        start = time.perf_counter()
+        response = await client.post(url, json=payload)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+    async def caller():
+        for _ in range(REQUESTS // CALLERS):
+            await one()
+
+    async with client:
+        await one()  # 预热连接
+        latencies.clear()
+        begin = time.perf_counter()
+        await asyncio.gather(*[caller() for _ in range(CALLERS)])
+        elapsed = time.perf_counter() - begin
+    latencies.sort()
+    print(
+        f'{name:<9} requests={len(latencies)} callers={CALLERS} elapsed={elapsed:.2f}s throughput={len(latencies) / elapsed:.0f}/s '
+        f'p50={statistics.median(latencies) * 1000:.1f}ms p95={latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms'
+    )
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    h1_server = await asyncio.start_server(handle_h1, HOST, H1_PORT)
+    h2_server = await loop.create_server(H2Protocol, HOST, H2_PORT)
+    # 速率上限设得足够高, 只比较连接/流的并发能力
+    rate = dict(limits=8, sleeps=8 / 100000)
+    await bench('HTTP/1.1', AsyncLimitClient(**rate), f'http://{HOST}:{H1_PORT}/')
+    await bench('HTTP/2', AsyncLimitClient(**rate, http2=True, http1=False, connections=1, streams=256), f'http://{HOST}:{H2_PORT}/')
+    h1_server.close()
+    h2_server.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Json 响应序列化速度对比: 分别用标准库 json 与 orjson 序列化 100 / 10000 个区块(字典与 pydantic 模型两种形式)
+两种实现的输出要求逐字节一致
+运行方式(项目根目录): python -m tools.bench_json
+"""
+import secrets
+import time
+
+from pydantic import BaseModel
+
+import views.render as render
+
+
+# 与 apps/web3/views.Block 相同的结构(避免导入 web3)
+class Block(BaseModel):
+    number: int
+    hash: str
+    timestamp: int
+    transactions: str
+
+
+def make_blocks(count: int) -> list[dict]:
+    return [
+        {
+            'number': 19000000 + i,
+            'hash': '0x' + secrets.token_hex(32),
+            'timestamp': 1700000000 + i * 12,
+            'transactions': ','.join('0x' + secrets.token_hex(32) for _ in range(150)),
+        }
+        for i in range(count)
+    ]
+
+
+def timeit(content, rounds: int) -> float:
+    begin = time.perf_counter()
+    for _ in range(rounds):
+        render.Json(content)
+    return (time.perf_counter() - begin) / rounds
+
+
+def bench(name: str, content, rounds: int):
+    fast = render.orjson
+    render.orjson = None
+    stdlib_body = render.Json(content).body
+    stdlib = timeit(content, rounds)
+    render.orjson = fast
+    orjson_body = render.Json(content).body
+    orjson = timeit(content, rounds)
+    assert stdlib_body == orjson_body, 'orjson output differs from stdlib json'
+    print(f'{name:<18} size={len(orjson_body) / 1024:>8.0f}KB stdlib={stdlib * 1000:>8.2f}ms orjson={orjson * 1000:>7.2f}ms speedup={stdlib / orjson:.1f}x')
+
+
+def main():
+    if render.orjson is None:
+        print('orjson is not installed')
+        return
+    for count, rounds in ((100, 200), (10000, 3)):
+        blocks = make_blocks(count)
+        bench(f'{count} blocks dict', blocks, rounds)
+        bench(f'{count} blocks model', [Block(**block) for block in blocks], rounds)
+
+
+if __name__ == '__main__':
+    main()
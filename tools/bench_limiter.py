@@ -0,0 +1,59 @@
+"""
+限频器压测: 1000 个并发调用者争抢同一个 AsyncLimiter, 检查实际速率与并发是否在配置范围内
+运行方式(项目根目录): python -m tools.bench_limiter
+"""
+import asyncio
+import random
+import time
+
+from data.fetch import AsyncLimiter
+
+CALLERS = 1000
+LIMITS = 200
+PERIOD = 1.0
+CONCURRENCY = 32
+
+
+# 统计任意 period 长度滑动窗口内的最大请求数
+def max_in_window(timestamps: list[float], period: float) -> int:
+    timestamps = sorted(timestamps)
+    best, left = 0, 0
+    for right, ts in enumerate(timestamps):
+        while ts - timestamps[left] >= period:
+            left += 1
+        best = max(best, right - left + 1)
+    return best
+
+
+async def run(limits: int = LIMITS, period: float = PERIOD, concurrency: int = CONCURRENCY, callers: int = CALLERS):
+    limiter = AsyncLimiter(limits=limits, period=period, concurrency=concurrency)
+    started: list[float] = []
+    running = 0
+    peak = 0
+
+    async def caller():
+        nonlocal running, peak
+        async with limiter:
+            started.append(time.monotonic())
+            running += 1
+            peak = max(peak, running)
+            # 模拟一次 5~50ms 的网络请求
+            await asyncio.sleep(random.uniform(0.005, 0.05))
+            running -= 1
+
+    begin = time.monotonic()
+    await asyncio.gather(*[caller() for _ in range(callers)])
+    elapsed = time.monotonic() - begin
+
+    window = max_in_window(started, period)
+    print(f'callers={callers} limits={limits}/{period}s concurrency={concurrency}')
+    print(f'elapsed={elapsed:.3f}s average rate={callers / elapsed:.1f}/s')
+    print(f'max requests in any {period}s window={window} (limit {limits})')
+    print(f'peak concurrency={peak} (limit {concurrency})')
+    assert window <= limits, f'rate limit exceeded: {window} > {limits}'
+    assert peak <= concurrency, f'concurrency limit exceeded: {peak} > {concurrency}'
+    print('OK')
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
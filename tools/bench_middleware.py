@@ -0,0 +1,89 @@
+"""
+RequestMiddleware 开销对比: 直接驱动 ASGI 应用(不经过网络), 分别测量无中间件、原 BaseHTTPMiddleware 实现与纯 ASGI 实现的单请求耗时
+访问日志输出被关闭, 只比较中间件本身的开销
+运行方式(项目根目录): python -m tools.bench_middleware
+"""
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+
+from middleware.request import Request, RequestMiddleware
+
+REQUESTS = 20000
+BODY = b'{"hello": "world"}' * 8
+
+
+# 原 BaseHTTPMiddleware 版本的 dispatch(去掉日志输出部分)
+class LegacyRequestMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next: RequestResponseEndpoint):
+        request = Request(request.scope, request.receive)
+        response = await call_next(request)
+        _ = f'{request.ip}#{request.region}-{request.method}<{response.status_code}>[{str(request.url.include_query_params())[:256]}]'
+        if response.status_code == 404:
+            response = Response(content=b'{"code": -1, "message": "Access Denied", "data": null}', status_code=403)
+        return response
+
+
+def create_app(middleware: type | None) -> FastAPI:
+    app = FastAPI()
+
+    @app.post('/echo')
+    async def echo(request: Request):
+        return Response(await request.body(), media_type='application/json')
+
+    if middleware is RequestMiddleware:
+        app.add_middleware(RequestMiddleware, public_key=open('public.pem').read())
+    elif middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+async def call(app: FastAPI, path: str) -> int:
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'bench'), (b'content-type', b'application/json'), (b'content-length', str(len(BODY)).encode())],
+        'client': ('127.0.0.1', 10000), 'server': ('bench', 80),
+    }
+    status = 0
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': BODY, 'more_body': False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def bench(name: str, app: FastAPI, path: str):
+    expected = await call(app, path)
+    begin = time.perf_counter()
+    for _ in range(REQUESTS):
+        await call(app, path)
+    elapsed = time.perf_counter() - begin
+    print(f'{name:<10} {path:<8} status={expected} {elapsed / REQUESTS * 1e6:.1f}us/request')
+
+
+async def main():
+    logging.getLogger('access').disabled = True
+    for path in ('/echo', '/missing'):
+        await bench('none', create_app(None), path)
+        await bench('legacy', create_app(LegacyRequestMiddleware), path)
+        await bench('asgi', create_app(RequestMiddleware), path)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+读取 100000 个区块的速度对比(临时 SQLite 文件):
+原实现(ORM 实体 + 逐列 getattr 的 as_dict + pydantic 逐条校验)、ORM 实体 + 缓存列名的 as_dict、
+Core 查询 fetch_rows 返回字典、Core 查询 fetch_rows 返回元组
+运行方式(项目根目录): python -m tools.bench_rows
+"""
+import asyncio
+import os
+import secrets
+import tempfile
+import time
+
+import sqlalchemy as sa
+from pydantic import BaseModel
+
+from data.db import bulk_upsert, declare_database, fetch_rows
+from web3_db import Block
+
+ROWS = 100_000
+ROUNDS = 3
+
+
+# 与 apps/web3/views.Block 相同的结构(避免导入 web3)
+class BlockModel(BaseModel):
+    number: int
+    hash: str
+    timestamp: int
+    transactions: str
+
+
+def legacy_as_dict(block: Block) -> dict:
+    return {c.name: getattr(block, c.name) for c in block.__table__.columns}
+
+
+async def orm_legacy(session):
+    result = await session.execute(sa.select(Block))
+    return [BlockModel.model_validate(legacy_as_dict(block)) for block in result.scalars().all()]
+
+
+async def orm_cached(session):
+    result = await session.execute(sa.select(Block))
+    return [block.as_dict() for block in result.scalars().all()]
+
+
+async def core_dicts(session):
+    return await fetch_rows(session, sa.select(Block.__table__))
+
+
+async def core_tuples(session):
+    return await fetch_rows(session, sa.select(Block.__table__), tuples=True)
+
+
+async def main():
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = declare_database(url=f'sqlite+aiosqlite:///{path}')
+    async with db() as session:
+        await session.execute(sa.schema.CreateTable(Block.__table__))
+        await bulk_upsert(session, Block, [
+            {'number': i, 'hash': secrets.token_hex(32), 'timestamp': 1700000000 + i * 12, 'transactions': secrets.token_hex(96)}
+            for i in range(ROWS)
+        ])
+        await session.commit()
+    baseline = None
+    for name, func in (('orm + as_dict + pydantic', orm_legacy), ('orm + cached as_dict', orm_cached),
+                       ('core dicts', core_dicts), ('core tuples', core_tuples)):
+        best = float('inf')
+        for _ in range(ROUNDS):
+            async with db() as session:
+                begin = time.perf_counter()
+                rows = await func(session)
+                best = min(best, time.perf_counter() - begin)
+            assert len(rows) == ROWS
+        baseline = baseline or best
+        print(f'{name:<26} {best * 1000:>8.0f}ms {ROWS / best:>10.0f} rows/s speedup={baseline / best:.1f}x')
+    await db.kw['bind'].dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+SQLite 多进程并发读写对比: 1 个写进程(模拟 task-worker 插入区块)与 2 个读进程(模拟 template-server 查询最新区块)
+共享同一个数据库文件, 分别使用 SQLite 默认参数与 SqlitePragmas(WAL 等), 统计吞吐、延迟与锁等待失败次数
+两种方式使用相同的 busy_timeout, 只比较日志模式等其余参数的差异
+运行方式(项目根目录): python -m tools.bench_sqlite
+"""
+import asyncio
+import multiprocessing
+import os
+import secrets
+import statistics
+import tempfile
+import time
+
+import sqlalchemy as sa
+
+from data.db import SqlitePragmas, declare_database
+from web3_db import Block
+
+DURATION = 5.0  # 每种参数的运行时间(秒)
+READERS = 2  # 读进程数
+CONCURRENCY = 4  # 每个读进程的并发查询数
+BATCH = 20  # 每个写事务插入的区块数
+BUSY_TIMEOUT = 200  # 等待写锁的最长时间(毫秒)
+
+PROFILES = {
+    'default': SqlitePragmas(journal_mode=None, synchronous=None, mmap_size=None, cache_size=None, temp_store=None,
+                             busy_timeout=BUSY_TIMEOUT),
+    'tuned': SqlitePragmas(busy_timeout=BUSY_TIMEOUT),
+}
+
+
+async def writer(url: str, pragmas: SqlitePragmas, deadline: float) -> tuple[list[float], int]:
+    db = declare_database(url=url, sqlite=pragmas)
+    latencies, errors, number = [], 0, os.getpid() * 10_000_000
+    while time.time() < deadline:
+        rows = [
+            {'number': number + i, 'hash': secrets.token_hex(32), 'timestamp': int(time.time()), 'transactions': secrets.token_hex(512)}
+            for i in range(BATCH)
+        ]
+        number += BATCH
+        begin = time.perf_counter()
+        try:
+            async with db() as session:
+                await session.execute(sa.insert(Block), rows)
+                await session.commit()
+            latencies.append(time.perf_counter() - begin)
+        except sa.exc.OperationalError:
+            errors += 1
+    await db.kw['bind'].dispose()
+    return latencies, errors
+
+
+async def reader(url: str, pragmas: SqlitePragmas, deadline: float) -> tuple[list[float], int]:
+    db = declare_database(url=url, pool_size=CONCURRENCY, sqlite=pragmas)
+    latencies, errors = [], 0
+
+    async def query():
+        nonlocal errors
+        while time.time() < deadline:
+            begin = time.perf_counter()
+            try:
+                async with db() as session:
+                    result = await session.execute(sa.select(Block).order_by(Block.number.desc()).limit(50))
+                    result.scalars().all()
+                latencies.append(time.perf_counter() - begin)
+            except sa.exc.OperationalError:
+                errors += 1
+
+    await asyncio.gather(*(query() for _ in range(CONCURRENCY)))
+    await db.kw['bind'].dispose()
+    return latencies, errors
+
+
+def worker(role: str, url: str, profile: str, deadline: float, results: multiprocessing.Queue):
+    func = writer if role == 'write' else reader
+    results.put((role, *asyncio.run(func(url, PROFILES[profile], deadline))))
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) >= 2 else (values[0] if values else 0.0)
+
+
+def run(profile: str):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    url = f'sqlite+aiosqlite:///{path}'
+
+    async def create():
+        db = declare_database(url=url, sqlite=PROFILES[profile])
+        async with db() as session:
+            await session.execute(sa.schema.CreateTable(Block.__table__))
+            await session.commit()
+        await db.kw['bind'].dispose()
+
+    asyncio.run(create())
+    results = multiprocessing.Queue()
+    deadline = time.time() + DURATION
+    processes = [multiprocessing.Process(target=worker, args=('write', url, profile, deadline, results))]
+    processes += [multiprocessing.Process(target=worker, args=('read', url, profile, deadline, results)) for _ in range(READERS)]
+    for process in processes:
+        process.start()
+    collected = {'write': ([], 0), 'read': ([], 0)}
+    for _ in processes:
+        role, latencies, errors = results.get()
+        collected[role] = (collected[role][0] + latencies, collected[role][1] + errors)
+    for process in processes:
+        process.join()
+    for role, (latencies, errors) in collected.items():
+        print(f'{profile:<8} {role:<6} ops/s={len(latencies) / DURATION:>8.0f} '
+              f'p50={percentile(latencies, 50) * 1000:>7.2f}ms p99={percentile(latencies, 99) * 1000:>8.2f}ms '
+              f'lock errors={errors}')
+
+
+def main():
+    for profile in PROFILES:
+        run(profile)
+
+
+if __name__ == '__main__':
+    main()
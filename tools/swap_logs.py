@@ -1,7 +1,8 @@
 import pandas as pd
 from web3 import Web3
+import settings
 
-w3 = Web3(Web3.HTTPProvider('https://mainnet.infura.io/v3/2a1f54e725154a56bd24606f28b283f2?enable=archive'))
+w3 = Web3(Web3.HTTPProvider(settings.RPC_URLS[0]))
 
 # csv表的数据格式
 data = {
@@ -1,15 +1,23 @@
-from typing import Any, Mapping
+from typing import Any, AsyncIterable, Mapping
 from fastapi.requests import Request as BaseRequest
-from fastapi.responses import JSONResponse, PlainTextResponse, Response as BaseResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response as BaseResponse, StreamingResponse
 from fastapi.exceptions import HTTPException as FastAPIHTTPException
 from starlette.types import ExceptionHandler
 from starlette.background import BackgroundTask
 from typing_extensions import Annotated, Doc
+from pydantic import BaseModel
 from decimal import Decimal
 import json as jsonlib
+import datetime
+import math
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
 
-__all__ = ['Text', 'Json', 'HTTPException']
+
+__all__ = ['Text', 'Json', 'RawJson', 'JsonStream', 'HTTPException']
 
 
 class Text(PlainTextResponse):
@@ -32,15 +40,61 @@ class Text(PlainTextResponse):
         super().__init__(content, status_code or status or 200, headers, None, background)
 
 
+_DECIMAL_QUANTUM = Decimal('0.000000000000000001')
+
+
+def json_default(obj: Any) -> Any:
+    """
+    标准库 json 与 orjson 共用的扩展类型转换
+    """
+    if isinstance(obj, Decimal):
+        return str(obj.quantize(_DECIMAL_QUANTUM))
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
 class JsonResponseEncoder(jsonlib.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, Decimal):
-            return str(obj.quantize(Decimal('0.000000000000000001')))
-        return super().default(obj)
+        return json_default(obj)
+
+
+def _has_non_finite(value: Any) -> bool:
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(v) for v in value)
+    if isinstance(value, BaseModel):
+        return _has_non_finite(value.model_dump())
+    return False
 
 
-class Pagination:
-    pass
+def dumps(content: Any) -> bytes:
+    """
+    序列化为紧凑的 UTF-8 JSON; 优先使用 orjson, 未安装或遇到 orjson 不支持的值(超过 64 位的整数等)时使用标准库
+    orjson 会把 NaN/inf 输出为 null, 输出中有 null 时检查内容, 含非有限浮点数则交给标准库抛出 ValueError
+    与标准库的差异: 大浮点数的指数不带 + 号(1e22 而不是 1e+22), 解析结果相同
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+        else:
+            if b'null' not in data or not _has_non_finite(content):
+                return data
+    return jsonlib.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(',', ':'),
+        cls=JsonResponseEncoder
+    ).encode('utf-8')
 
 
 class Json(BaseResponse):
@@ -63,14 +117,55 @@ class Json(BaseResponse):
         }, status_code or status or 200, headers, None, background)
 
     def render(self, content: Any) -> bytes:
-        return jsonlib.dumps(
-            content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(',', ':'),
-            cls=JsonResponseEncoder
-        ).encode('utf-8')
+        return dumps(content)
+
+
+class RawJson(BaseResponse):
+    """
+    不包装 code/message 的 JSON 响应; 直接返回 Response 时 FastAPI 不再按 response_model 校验,
+    用于返回数据库中的可信数据(response_model 仍用于生成文档)
+    """
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class JsonStream(StreamingResponse):
+    """
+    流式输出 {"code":..,"message":..,"data":[...]}: 从异步迭代器逐个序列化数组元素, 每凑满 chunk_size 字节发送一次,
+    不在内存中保存整个结果集; 开始发送后出错只能中断连接(客户端会得到不完整的 JSON)
+    """
+    media_type = 'application/json'
+
+    def __init__(self,
+                 items: AsyncIterable[Any],
+                 *,
+                 code: int = 0,
+                 message: str = 'ok',
+                 status_code: int | None = None,
+                 status: int | None = None,
+                 headers: Mapping[str, str] | None = None,
+                 background: BackgroundTask | None = None,
+                 chunk_size: int = 64 * 1024
+                 ) -> None:
+        head = dumps({'code': code, 'message': message})[:-1] + b',"data":['
+        super().__init__(self._iterate(head, items, chunk_size), status_code or status or 200, headers, None, background)
+
+    @staticmethod
+    async def _iterate(head: bytes, items: AsyncIterable[Any], chunk_size: int):
+        buffer = bytearray(head)
+        first = True
+        async for item in items:
+            if not first:
+                buffer += b','
+            first = False
+            buffer += dumps(item)
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b']}'
+        yield bytes(buffer)
 
 
 class HTTPException(FastAPIHTTPException):
@@ -1,6 +1,7 @@
-from data.db import declare_database, Base
+from data.db import declare_database, bulk_upsert, fetch_rows, stream_rows, Base, Pagination
 import sqlalchemy as sa
 from sqlalchemy import create_engine, Column, String, Integer, Text
+import functools
 
 
 class Block(Base):
@@ -11,9 +12,15 @@ class Block(Base):
     transactions = Column(Text)  # 交易的哈希值拼接而成的字符串
 
 
+# 数据库连接工厂(每个进程只创建一次, 复用连接池与 SQLite 连接参数)
+@functools.cache
+def web3_database():
+    return declare_database(url='sqlite+aiosqlite:////data/web3.db')
+
+
 # 创建表
 async def create_table():
-    db = declare_database(url='sqlite+aiosqlite:////data/web3.db')
+    db = web3_database()
     async with db() as session:
         await session.execute(sa.schema.CreateTable(Block.__table__))
         await session.commit()
@@ -22,57 +29,73 @@ async def create_table():
 
 # 根据区块号获取区块数据
 async def get_block(number):
-    db = declare_database(url='sqlite+aiosqlite:////data/web3.db')
+    db = web3_database()
     async with db() as session:
         result_query = await session.execute(sa.select(Block).where(Block.number == number))
         result = result_query.scalar()
         return result
 
 
-# 插入区块数据（单/多均可插入）
+# 插入区块数据（单/多均可插入）, 已存在的区块(区块号或哈希重复)跳过, 返回插入与跳过的行数
 async def insert_block(block):
     print("任务开始执行")
-    db = declare_database(url='sqlite+aiosqlite:////data/web3.db')
+    if isinstance(block, dict):
+        block = [block]
+    db = web3_database()
     async with db() as session:
         try:
-            result = await session.execute(sa.insert(Block).values(block))
-            print("影响行数：", result.rowcount)
-            # session.add(Block(**block))
+            result = await bulk_upsert(session, Block, block)
+            print("插入行数：", result.inserted, "跳过行数：", result.skipped)
             await session.commit()
             print("插入数据成功")
+            return result
         except Exception as e:
             await session.rollback()
             raise e
 
 
-# 获取特定区间范围内的区块数据
+# 用链上数据覆盖已存在的区块(区块被重组时修正数据库中的旧数据)
+async def replace_block(block: dict):
+    db = web3_database()
+    async with db() as session:
+        await bulk_upsert(session, Block, [block], update=['hash', 'timestamp', 'transactions'])
+        await session.commit()
+
+
+# 获取特定区间范围内的区块数据(Core 查询直接返回字典, 不创建 ORM 对象)
 async def get_blocks(start: int, end: int):
-    db = declare_database(url='sqlite+aiosqlite:////data/web3.db')
+    db = web3_database()
     async with db() as session:
-        # 获取区间范围内的区块数据
-        result_query = await session.execute(sa.select(Block).where(Block.number.between(start, end)))
-        results = result_query.scalars().all()
-        block_list = []
-        for result in results:
-            block_list.append(result.as_dict())
-        # print(block_list)
-        await session.close()
-    return block_list
+        return await fetch_rows(session, sa.select(Block.__table__).where(Block.number.between(start, end)))
 
 
 # 按照时间戳倒序，获取最新的100条区块数据
 async def query():
-    db = declare_database(url='sqlite+aiosqlite:////data/web3.db')
+    db = web3_database()
     async with db() as session:
-        # 获取区间范围内的区块数据
-        result_query = await session.execute(sa.select(Block).order_by(Block.timestamp).limit(100))
-        results = result_query.scalars().all()
-        block_list = []
-        for result in results:
-            block_list.append(result.as_dict())
-        # print(block_list)
-        await session.close()
-    return block_list
+        return await fetch_rows(session, sa.select(Block.__table__).order_by(Block.timestamp).limit(100))
+
+
+# 按区块号倒序的游标分页
+block_pagination = Pagination(Block.number, limit=100, max_limit=1000, descending=True)
+
+
+# 分页获取区块数据, 返回 {'items': [...], 'next': 下一页游标}
+async def get_block_page(cursor: str | None = None, limit: int | None = None):
+    db = web3_database()
+    async with db() as session:
+        rows = await fetch_rows(session, block_pagination.apply(sa.select(Block.__table__), cursor, limit))
+        return block_pagination.page(rows, limit)
+
+
+# 逐批读取区间内的区块数据(不一次性加载到内存)
+async def stream_blocks(start: int, end: int):
+    db = web3_database()
+    async with db() as session:
+        stmt = sa.select(Block.__table__).where(Block.number.between(start, end)).order_by(Block.number)
+        async for rows in stream_rows(session, stmt):
+            for row in rows:
+                yield row
 
 
 if __name__ == '__main__':